@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Precompute the captions and crops of the whole photo library.
+
+Run `python batch.py` once (and again after adding photos) and
+`instacron.py` will use the stored caption and crop instead of parsing
+the EXIF data, geocoding and searching for the best crop while posting.
+
+The EXIF parsing and crop search run in a process pool and the
+geocoding in a (smaller) thread pool. The results are stored in the
+catalog one photo at a time, so an interrupted run continues where it
+left off.
+"""
+
+import os.path
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from termcolor import colored
+
+import instacron
+
+
+def _analyze(photo, crop_score="entropy"):
+    """Everything about a photo that does not need the network."""
+    location = instacron._location_caption_from_fname(photo)
+    if location is None:
+        lat_long, date = instacron._lat_long_and_time_from_exif(photo)
+    else:
+        lat_long, date = None, None
+    camera_settings = instacron.get_camera_settings(photo)
+    box = instacron.find_crop_box(photo, crop_score)
+    return location, lat_long, date, camera_settings, box
+
+
+def _caption(location, lat_long, date, camera_settings):
+    if location is None:
+        address = instacron.reverse_geocode(*lat_long) if lat_long else None
+        location = instacron._location_caption_from_address(address, date)
+    return instacron.compose_caption(*location, camera_settings)
+
+
+def precompute(catalog, processes=None, threads=4, crop_score="entropy"):
+    """Store the caption and crop box (found with `crop_score`) of every
+    photo in `catalog` that does not have them yet. Returns the number
+    of photos processed."""
+    todo = catalog.without_metadata()
+    t_start = time.time()
+    n_done = 0
+    with ProcessPoolExecutor(processes) as process_pool, ThreadPoolExecutor(
+        threads
+    ) as thread_pool:
+        analyses = {
+            process_pool.submit(_analyze, path, crop_score): (name, None)
+            for name, path in todo
+        }
+        captions = {}
+        while analyses or captions:
+            done, _ = wait(set(analyses) | set(captions), return_when=FIRST_COMPLETED)
+            for future in done:
+                in_analyses = future in analyses
+                name, box = (
+                    analyses.pop(future) if in_analyses else captions.pop(future)
+                )
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(colored(f"\nSkipping {name}: {e!r}", "red"))
+                    continue
+                if in_analyses:  # Continue with the geocoding
+                    *parts, box = result
+                    captions[thread_pool.submit(_caption, *parts)] = name, box
+                else:
+                    catalog.set_metadata(name, {"caption": result, "crop_box": box})
+                    n_done += 1
+                    rate = n_done / (time.time() - t_start)
+                    print(
+                        f"\r{n_done}/{len(todo)} photos, {rate:.2f} photos/sec", end=""
+                    )
+    print()
+    return n_done
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="number of processes for the image work, all cores if empty.",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=4, help="number of parallel geocode lookups."
+    )
+    parser.add_argument(
+        "--crop",
+        choices=list(instacron.CROP_SCORES),
+        default="entropy",
+        help="what the crop should keep the most of.",
+    )
+    args = parser.parse_args()
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    upload_log = instacron.get_upload_log(dir_path)
+    catalog = instacron.get_catalog(upload_log, os.path.join(dir_path, "photos"))
+    precompute(catalog, args.processes, args.threads, args.crop)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Measure how fast `catalog.Catalog` picks a photo in a large library.
+
+For every size, a temporary folder is filled with that many (empty)
+photos and an upload log where every photo was uploaded about twice.
+It times:
+
+- building the catalog from scratch (the first run),
+- opening the catalog and picking a random least-uploaded photo, when
+  nothing changed (every run of `instacron.py` after the first),
+- the same after one upload, which reads only the new upload and moves
+  only that photo to another bucket,
+- the same after one new photo, which rescans the folder.
+
+Run `python benchmarks/catalog.py`, by default at 10k, 100k and 1M
+photos (the last one needs a few minutes and about 1 GB of disk).
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_library(folder, n_photos, uploads_per_photo=2, seed=0):
+    """Write `n_photos` photos and an upload log into `folder`."""
+    import uploadlog
+
+    photo_folder = os.path.join(folder, "photos")
+    os.makedirs(photo_folder)
+    names = [f"{i}-20151121-Peru-Cusco.jpg" for i in range(n_photos)]
+    for name in names:
+        open(os.path.join(photo_folder, name), "wb").close()
+    rng = random.Random(seed)
+    uploads = rng.choices(names, k=uploads_per_photo * n_photos)
+    upload_log = uploadlog.UploadLog(os.path.join(folder, "uploaded.log"))
+    upload_log.extend(uploads, t=0)
+    upload_log.compact()
+    return upload_log, photo_folder
+
+
+def _timed(f, repeat=1):
+    """Seconds of the fastest of `repeat` calls of `f`."""
+    seconds = []
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        f()
+        seconds.append(time.perf_counter() - t_start)
+    return min(seconds)
+
+
+def measure(n_photos, repeat=5):
+    """{step: seconds} for a library of `n_photos` photos."""
+    from catalog import Catalog
+    from uploadlog import UploadLog
+
+    with tempfile.TemporaryDirectory() as folder:
+        upload_log, photo_folder = make_library(folder, n_photos)
+        fname = os.path.join(folder, "catalog.sqlite")
+
+        def pick():
+            catalog = Catalog(fname, photo_folder, UploadLog(upload_log.fname))
+            photo = catalog.random_least_uploaded()
+            catalog.close()
+            return photo
+
+        results = {"build": _timed(pick)}
+        results["open and pick"] = _timed(pick, repeat)
+
+        upload = []
+        new_photo = []
+        for i in range(repeat):
+            UploadLog(upload_log.fname).append(f"{i}-20151121-Peru-Cusco.jpg")
+            upload.append(_timed(pick))
+            open(os.path.join(photo_folder, f"new-{i}.jpg"), "wb").close()
+            new_photo.append(_timed(pick))
+        results["upload, open and pick"] = min(upload)
+        results["new photo, open and pick"] = min(new_photo)
+        return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Photo catalog benchmark.")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="numbers of photos.",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs per step.")
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+    for n_photos in args.sizes:
+        print(f"{n_photos} photos")
+        for step, seconds in measure(n_photos, args.repeat).items():
+            print(f"  {step:<25} {1000 * seconds:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Compare the crop search with the `scipy.optimize.minimize_scalar` one
+that `instacron.crop_maximize_entropy` used before.
+
+The photo is a synthetic panorama with a few detailed regions on a
+smooth background, so the entropy along it has several maxima. For
+every search it prints the time it took and the entropy of the crop it
+chose; the old search often stops at a local maximum.
+
+It also times `instacron.crop_box_multiscale` with every crop score on
+a 12 MP JPEG, which must stay within `SCORE_BUDGETS`.
+
+Run `python benchmarks/crop.py` (needs scipy), by default on a 48 MP
+photo. It fails when a score is over budget.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds that finding the crop of a `SCORE_SIZE` JPEG may take
+SCORE_SIZE = (6000, 2000)
+SCORE_BUDGETS = {"entropy": 0.6, "edges": 0.4, "saliency": 0.4, "thirds": 0.4}
+
+
+def panorama(width, height, n_regions=4, seed=0):
+    """A smooth gradient with `n_regions` noisy regions of different
+    strength, as an (height, width, 3) array."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    data = np.empty((height, width, 3), np.uint8)
+    data[:] = np.linspace(88, 128, width, dtype=np.uint8)[None, :, None]
+    size = height // 2
+    for i, x in enumerate(rng.choice(width - size, n_regions, replace=False)):
+        amplitude = 64 * (i + 1)
+        block = rng.integers(0, amplitude, (size, size, 3), dtype=np.uint8)
+        data[size // 2 : size // 2 + size, x : x + size] += block // 2
+    return data
+
+
+def crop_box_minimize_scalar(img, min_ratio=4 / 5, max_ratio=90 / 47):
+    """The crop box that the old `crop_maximize_entropy` chose."""
+    import numpy as np
+    import PIL.Image
+    from scipy.optimize import minimize_scalar
+
+    def entropy(data):
+        hist = np.array(PIL.Image.fromarray(data).histogram())
+        hist = hist / hist.sum()
+        hist = hist[hist != 0]
+        return -np.sum(hist * np.log2(hist))
+
+    w, h = img.size
+    data = np.array(img)
+    if w / h > max_ratio:  # Too wide
+        w_max = int(max_ratio * h)
+        xy_max = w - w_max
+
+        def box(x):
+            return (int(x), 0, int(x) + w_max, h)
+
+    else:  # Too narrow
+        h_max = int(w / min_ratio)
+        xy_max = h - h_max
+
+        def box(y):
+            return (0, int(y), w, int(y) + h_max)
+
+    def to_minimize(xy):
+        left, upper, right, lower = box(xy)
+        return -entropy(data[upper:lower, left:right])
+
+    return box(minimize_scalar(to_minimize, bounds=(0, xy_max), method="bounded").x)
+
+
+def entropy_of(img, box):
+    return img.crop(box).entropy()
+
+
+def compare(width, height):
+    """{search: (seconds, entropy of its crop)} on a panorama."""
+    import PIL.Image
+
+    import instacron
+
+    img = PIL.Image.fromarray(panorama(width, height))
+    searches = {
+        "minimize_scalar": lambda: crop_box_minimize_scalar(img),
+        "sliding window": lambda: instacron.crop_box_maximize_entropy(img),
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        photo = os.path.join(folder, "panorama.jpg")
+        img.save(photo, quality=95)
+        searches["multiscale (JPEG)"] = lambda: instacron.crop_box_multiscale(photo)
+        results = {}
+        for search, find_box in searches.items():
+            t_start = time.perf_counter()
+            box = find_box()
+            results[search] = time.perf_counter() - t_start, entropy_of(img, box)
+    return results
+
+
+def time_scores(width, height, repeat=3):
+    """{score: seconds} of the crop search on a JPEG panorama."""
+    import PIL.Image
+
+    import instacron
+
+    img = PIL.Image.fromarray(panorama(width, height))
+    with tempfile.TemporaryDirectory() as folder:
+        photo = os.path.join(folder, "panorama.jpg")
+        img.save(photo, quality=95)
+        results = {}
+        for score in instacron.CROP_SCORES:
+            seconds = []
+            for _ in range(repeat):
+                t_start = time.perf_counter()
+                instacron.crop_box_multiscale(photo, score=score)
+                seconds.append(time.perf_counter() - t_start)
+            results[score] = min(seconds)
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Crop search benchmark.")
+    parser.add_argument("--width", type=int, default=12000, help="in pixels.")
+    parser.add_argument("--height", type=int, default=4000, help="in pixels.")
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+    print(f"{args.width}x{args.height} ({args.width * args.height / 1e6:.0f} MP)")
+    for search, (seconds, entropy) in compare(args.width, args.height).items():
+        print(f"{search:<18} {seconds:7.2f} s, entropy {entropy:.4f} bits")
+    width, height = SCORE_SIZE
+    print(f"\nCrop scores at {width}x{height} ({width * height / 1e6:.0f} MP)")
+    over = False
+    for score, seconds in time_scores(width, height).items():
+        budget = SCORE_BUDGETS[score]
+        over |= seconds > budget
+        print(f"{score:<18} {seconds:7.2f} s (budget {budget:.1f} s)")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
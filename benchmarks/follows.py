@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Measure one maintenance cycle of `follow_bot.py` with many follows.
+
+A cycle runs `MyBot.unfollow_if_max_following` and
+`MyBot.unfollow_after_time`, which both unfollow the oldest temporary
+follows, at most `max_unfollows` each. `tmp_following` is imported from
+a `config/tmp_following.txt` that lists the follows in random order of
+time, and the Instagram API is replaced by a stub that does nothing, so
+only the bookkeeping is timed. It checks that exactly the oldest follows
+were unfollowed.
+
+Run `python benchmarks/follows.py`, by default at 100k follows.
+"""
+
+import atexit
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAY = 86400
+
+
+class StubBot:
+    """The parts of `instabot.Bot` that unfollowing takes."""
+
+    def __init__(self, following):
+        self.api = types.SimpleNamespace(last_json=None, unfollow=lambda u: None)
+        self.user_id = "0"
+        self.last = {}
+        self.following = following
+
+    def get_user_following(self, user_id):
+        return self.following
+
+    def get_user_followers(self, user_id):
+        return []
+
+
+def write_follows(fname, n_follows, seed=0):
+    """Write `n_follows` follows of the last 10 days, shuffled, returns
+    their user ids from old to new."""
+    rng = random.Random(seed)
+    now = time.time()
+    follows = [(str(i), now - rng.uniform(0, 10 * DAY)) for i in range(n_follows)]
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with open(fname, "w") as f:
+        f.writelines(f"{user_id},{t}\n" for user_id, t in follows)
+    return [user_id for user_id, _ in sorted(follows, key=lambda f: f[1])]
+
+
+def cycle(n_follows, max_unfollows=10):
+    """Seconds of one cycle and whether it unfollowed the oldest follows."""
+    import follow_bot
+    import store
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)  # `MyBot` keeps its lists in "config/"
+        store.open_store.cache_clear()
+        try:
+            oldest = write_follows("config/tmp_following.txt", n_follows)
+            with contextlib.redirect_stdout(io.StringIO()):
+                my_bot = follow_bot.MyBot(StubBot(oldest))
+                atexit.unregister(my_bot.close)
+                my_bot.following.set  # Downloaded before the cycle
+                t_start = time.perf_counter()
+                my_bot.unfollow_if_max_following(
+                    n_follows - max_unfollows, max_unfollows
+                )
+                my_bot.unfollow_after_time(4, max_unfollows)
+                seconds = time.perf_counter() - t_start
+                unfollowed = my_bot.unfollowed.set
+                my_bot.close()
+            store.open_store().close()
+        finally:
+            store.open_store.cache_clear()
+            os.chdir(cwd)
+    ok = unfollowed == set(oldest[: 2 * max_unfollows])
+    return seconds, ok
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Unfollow cycle benchmark.")
+    parser.add_argument(
+        "--follows", type=int, default=100_000, help="number of follows."
+    )
+    parser.add_argument(
+        "--max_unfollows", type=int, default=10, help="unfollows per method."
+    )
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+    seconds, ok = cycle(args.follows, args.max_unfollows)
+    print(f"{args.follows} follows: {1000 * seconds:.1f} ms per cycle")
+    if not ok:
+        print("Did not unfollow the oldest follows!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Measure how fast `cronjob.py` and a caption-only post start.
+
+`cronjob.py` runs every minute of the posting hours and mostly finds
+that there is nothing to do, and `--caption_only` should not pay for the
+imports of the image processing and the Instagram API. Every path runs
+in a fresh interpreter, in a temporary folder with a recent upload, a
+photo whose name has the location and a filled quote pool (so nothing
+touches the network). Its time minus that of an empty interpreter is
+compared with its budget in `BUDGETS`, and `python -X importtime` tells
+which modules it imported and what they took.
+
+Run `python benchmarks/startup.py`, which fails when a path is over
+budget or imports one of the `HEAVY` modules.
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds on top of the start of the interpreter itself
+BUDGETS = {"import instacron": 0.03, "nothing to do": 0.02, "caption only": 0.1}
+
+# Modules that none of these paths needs
+HEAVY = ["numpy", "PIL", "instabot", "geocoder", "requests", "wikiquotes", "scipy"]
+
+CAPTION_ONLY = """
+import instacron
+
+folder = {folder!r}
+upload_log = instacron.get_upload_log(folder)
+catalog = instacron.get_catalog(upload_log, folder + "/photos")
+instacron.post(upload_log, catalog, {photo!r}, caption_only=True)
+"""
+
+
+def make_folder(folder):
+    """Write what the paths need into `folder`, returns their commands."""
+    import numpy as np
+    import PIL.Image
+
+    import instacron
+    import uploadlog
+
+    os.makedirs(os.path.join(folder, "photos"))
+    photo = os.path.join(folder, "photos", "1-20151121-Peru-Cusco.jpg")
+    exif = PIL.Image.Exif()
+    exif[0x010F], exif[0x0110] = "Sony", "ILCE-7M3"  # Make, Model
+    exif_ifd = exif.get_ifd(0x8769)
+    exif_ifd[0xA434] = "FE 24-70mm F2.8 GM"  # LensModel
+    exif_ifd[0x920A], exif_ifd[0x829A], exif_ifd[0x829D] = 35.0, 0.004, 8.0
+    exif_ifd[0x8827] = 100  # ISOSpeedRatings
+    PIL.Image.fromarray(np.zeros((400, 500, 3), np.uint8)).save(photo, exif=exif)
+
+    quotes = os.path.join(folder, ".cache", "instacron", "quotes.json")
+    os.makedirs(os.path.dirname(quotes))
+    pool = {key: [f"Quote {i}" for i in range(100)] for key in instacron.PEOPLE}
+    pool[""] = [f"Quote {i}" for i in range(100)]
+    with open(quotes, "w", encoding="utf-8") as f:
+        json.dump({"pool": pool, "recent": []}, f)
+
+    uploadlog.UploadLog(os.path.join(folder, "uploaded.log")).append("other.jpg")
+    cronjob = shutil.copy(os.path.join(ROOT, "cronjob.py"), folder)
+    caption_only = CAPTION_ONLY.format(folder=folder, photo=photo)
+    return {
+        "import instacron": ["-c", "import instacron"],
+        "nothing to do": [cronjob],
+        "caption only": ["-c", caption_only],
+    }
+
+
+def run(args, env, importtime=False):
+    """Seconds that `python args` took, and its stderr."""
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + args
+    t_start = time.perf_counter()
+    result = subprocess.run(
+        cmd, env=env, cwd=env["HOME"], capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - t_start, result.stderr
+
+
+def imports(stderr):
+    """{module: cumulative seconds} from the output of `-X importtime`."""
+    pattern = r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)"
+    return {module: int(us) / 1e6 for us, _, module in re.findall(pattern, stderr)}
+
+
+def measure(repeat=5):
+    """{path: (seconds over the empty interpreter, {module: seconds})}."""
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_folder(folder)
+        env = dict(os.environ, HOME=folder, PYTHONPATH=ROOT)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)  # Like cron, use the .pyc
+        for args in paths.values():
+            run(args, env)  # Write the .pyc files
+        empty = min(run(["-c", "pass"], env)[0] for _ in range(repeat))
+        results = {}
+        for path, args in paths.items():
+            seconds = min(run(args, env)[0] for _ in range(repeat))
+            results[path] = seconds - empty, imports(run(args, env, True)[1])
+        return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Startup benchmark.")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per path.")
+    parser.add_argument(
+        "--top", type=int, default=8, help="slowest imports to show per path."
+    )
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+    over = False
+    for path, (seconds, modules) in measure(args.repeat).items():
+        heavy = sorted(set(HEAVY) & {m.split(".")[0] for m in modules})
+        budget = BUDGETS[path]
+        ok = seconds <= budget and not heavy
+        over |= not ok
+        print(f"{path}: {1000 * seconds:.1f} ms (budget {1000 * budget:.0f} ms)")
+        if heavy:
+            print(f"  imports {', '.join(heavy)}")
+        slowest = sorted(modules.items(), key=lambda item: -item[1])
+        for module, t in slowest[: args.top]:
+            print(f"  {1000 * t:7.1f} ms  {module}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
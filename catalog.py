@@ -0,0 +1,254 @@
+"""Catalog of the photo library, stored in SQLite.
+
+The catalog keeps the path, modification time, upload count and
+(optionally) pre-extracted metadata of every photo. It only rescans the
+photo folder when the folder itself changed and only reads the uploads
+that were added to the `uploadlog.UploadLog` since the last run.
+
+The photos in the folder are kept in buckets by upload count. Within a
+bucket every photo has a unique position `pos` in `range(size)`, so a
+random least-uploaded photo is a single index lookup, and moving a
+photo between buckets only touches the last photo of its old bucket.
+"""
+
+import json
+import os
+import random
+import sqlite3
+from collections import Counter
+
+# Rebuild all buckets at once when more photos than this changed.
+REINDEX_THRESHOLD = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS photos (
+    name TEXT PRIMARY KEY,
+    path TEXT,
+    mtime REAL,
+    n_uploads INTEGER NOT NULL DEFAULT 0,
+    pos INTEGER,
+    metadata TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS photos_bucket
+    ON photos (n_uploads, pos) WHERE pos IS NOT NULL;
+CREATE TABLE IF NOT EXISTS buckets (
+    n_uploads INTEGER PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+class Catalog:
+    """Photos in `photo_folder` and how often they have been uploaded.
+
+    Photos that are removed from the folder keep their upload count (with
+    their `path` and `pos` set to NULL), so it is still known when they
+    come back.
+
+    Metadata that is missing is looked up in the catalog
+    `shared_metadata`, if given, so accounts that post from the same
+    folder only need to precompute it once.
+    """
+
+    def __init__(self, fname, photo_folder, upload_log=None, shared_metadata=None):
+        self.photo_folder = photo_folder
+        self.upload_log = upload_log
+        self.db = sqlite3.connect(fname)
+        self.db.executescript(SCHEMA)
+        self.shared = shared_metadata is not None
+        if self.shared:
+            self.db.execute("ATTACH DATABASE ? AS shared", (shared_metadata,))
+        self.update()
+
+    def _get_state(self, key, default=None):
+        row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,))
+        row = row.fetchone()
+        return default if row is None else row[0]
+
+    def _set_state(self, key, value):
+        self.db.execute("REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def update(self):
+        with self.db:
+            photos = self._scan_photos()
+            counts, recount = self._read_uploads()
+            if recount:
+                self.db.execute("UPDATE photos SET n_uploads = 0, pos = NULL")
+            touched = {name for name, *_ in photos} | counts.keys()
+            incremental = not recount and len(touched) <= REINDEX_THRESHOLD
+            if incremental:
+                for name in touched:
+                    self._bucket_remove(name)
+            else:
+                self.db.execute("UPDATE photos SET pos = NULL")
+            self._update_photos(photos)
+            self._update_uploads(counts)
+            if incremental:
+                for name in touched:
+                    self._bucket_add(name)
+            else:
+                self._reindex()
+
+    def _scan_photos(self):
+        """The photos that were added, changed or removed."""
+        folder_mtime = os.path.getmtime(self.photo_folder)
+        if self._get_state("folder_mtime") == folder_mtime:
+            return []
+        self._set_state("folder_mtime", folder_mtime)
+        photos = {
+            entry.name: (entry.path, entry.stat().st_mtime)
+            for entry in os.scandir(self.photo_folder)
+            if entry.name.endswith(".jpg") and not entry.name.startswith(".")
+        }
+        known = dict(
+            self.db.execute("SELECT name, mtime FROM photos WHERE path IS NOT NULL")
+        )
+        gone = [(name, None, None) for name in known.keys() - photos.keys()]
+        changed = [
+            (name, path, mtime)
+            for name, (path, mtime) in photos.items()
+            if known.get(name) != mtime
+        ]
+        return gone + changed
+
+    def _update_photos(self, photos):
+        self.db.executemany(
+            "INSERT INTO photos (name, path, mtime) VALUES (?, ?, ?)"
+            " ON CONFLICT (name) DO UPDATE"
+            " SET path = excluded.path, mtime = excluded.mtime, metadata = NULL",
+            photos,
+        )
+
+    def _read_uploads(self):
+        """Count the uploads that were added to `upload_log`, or all
+        uploads when we cannot tell which ones are new."""
+        if self.upload_log is None:
+            return Counter(), False
+        new = self.upload_log.since(self._get_state("upload_seq", 0))
+        self._set_state("upload_seq", self.upload_log.seq)
+        if new is None:
+            return Counter(self.upload_log.counts), True
+        return Counter(new), False
+
+    def _update_uploads(self, counts):
+        self.db.executemany(
+            "INSERT INTO photos (name, n_uploads) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET n_uploads = n_uploads + excluded.n_uploads",
+            counts.items(),
+        )
+
+    def _bucket_size(self, n_uploads):
+        row = self.db.execute(
+            "SELECT size FROM buckets WHERE n_uploads = ?", (n_uploads,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def _bucket_remove(self, name):
+        """Take a photo out of its bucket by moving the last photo of the
+        bucket into its place."""
+        row = self.db.execute(
+            "SELECT n_uploads, pos FROM photos WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None or row[1] is None:
+            return
+        n_uploads, pos = row
+        last = self._bucket_size(n_uploads) - 1
+        self.db.execute("UPDATE photos SET pos = NULL WHERE name = ?", (name,))
+        self.db.execute(
+            "UPDATE photos SET pos = ? WHERE n_uploads = ? AND pos = ?",
+            (pos, n_uploads, last),
+        )
+        if last:
+            self.db.execute(
+                "UPDATE buckets SET size = ? WHERE n_uploads = ?", (last, n_uploads)
+            )
+        else:
+            self.db.execute("DELETE FROM buckets WHERE n_uploads = ?", (n_uploads,))
+
+    def _bucket_add(self, name):
+        """Put a photo at the end of the bucket of its upload count."""
+        row = self.db.execute(
+            "SELECT n_uploads FROM photos WHERE name = ? AND path IS NOT NULL",
+            (name,),
+        ).fetchone()
+        if row is None:
+            return
+        (n_uploads,) = row
+        size = self._bucket_size(n_uploads)
+        self.db.execute("UPDATE photos SET pos = ? WHERE name = ?", (size, name))
+        self.db.execute(
+            "REPLACE INTO buckets (n_uploads, size) VALUES (?, ?)",
+            (n_uploads, size + 1),
+        )
+
+    def _reindex(self):
+        """Rebuild all buckets from scratch."""
+        self.db.execute(
+            "UPDATE photos SET pos = bucket.pos FROM ("
+            " SELECT name, ROW_NUMBER() OVER (PARTITION BY n_uploads) - 1 AS pos"
+            " FROM photos WHERE path IS NOT NULL"
+            ") AS bucket WHERE photos.name = bucket.name"
+        )
+        self.db.execute("DELETE FROM buckets")
+        self.db.execute(
+            "INSERT INTO buckets (n_uploads, size) SELECT n_uploads, COUNT(*)"
+            " FROM photos WHERE pos IS NOT NULL GROUP BY n_uploads"
+        )
+
+    def _least_uploaded_bucket(self):
+        return self.db.execute(
+            "SELECT n_uploads, size FROM buckets ORDER BY n_uploads LIMIT 1"
+        ).fetchone()
+
+    def least_uploaded(self):
+        """Paths of the photos that have been uploaded the least."""
+        bucket = self._least_uploaded_bucket()
+        if bucket is None:
+            return []
+        rows = self.db.execute(
+            "SELECT path FROM photos WHERE n_uploads = ? AND pos IS NOT NULL",
+            (bucket[0],),
+        )
+        return [path for path, in rows]
+
+    def random_least_uploaded(self):
+        """Path of a random photo out of the ones uploaded the least."""
+        bucket = self._least_uploaded_bucket()
+        if bucket is None:
+            return None
+        n_uploads, size = bucket
+        row = self.db.execute(
+            "SELECT path FROM photos WHERE n_uploads = ? AND pos = ?",
+            (n_uploads, random.randrange(size)),
+        ).fetchone()
+        return row[0]
+
+    def without_metadata(self):
+        """Names and paths of the photos that have no metadata yet."""
+        return self.db.execute(
+            "SELECT name, path FROM photos WHERE path IS NOT NULL AND metadata IS NULL"
+        ).fetchall()
+
+    def get_metadata(self, name):
+        row = self.db.execute("SELECT metadata FROM photos WHERE name = ?", (name,))
+        row = row.fetchone()
+        if (row is None or row[0] is None) and self.shared:
+            row = self.db.execute(
+                "SELECT metadata FROM shared.photos WHERE name = ?", (name,)
+            ).fetchone()
+        if row is not None and row[0] is not None:
+            return json.loads(row[0])
+
+    def set_metadata(self, name, metadata):
+        with self.db:
+            self.db.execute(
+                "UPDATE photos SET metadata = ? WHERE name = ?",
+                (json.dumps(metadata), name),
+            )
+
+    def close(self):
+        self.db.close()
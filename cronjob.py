@@ -10,10 +10,18 @@ By adding the following line after executing `crontab -e`:
 import os.path
 import time
 
+import uploadlog
+
 dir_path = os.path.dirname(os.path.realpath(__file__))
-uploaded = os.path.join(dir_path, "uploaded.txt")
+uploaded = os.path.join(dir_path, "uploaded.log")
+if os.path.exists(uploaded):
+    # Not the modification time, migrating or compacting the log changes it
+    last_upload = uploadlog.UploadLog(uploaded).last_upload() or 0
+else:
+    # Not migrated from `uploaded.txt` yet
+    last_upload = os.path.getmtime(os.path.join(dir_path, "uploaded.txt"))
 
-if time.time() - os.path.getmtime(uploaded) > 24 * 3600:
+if time.time() - last_upload > 24 * 3600:
     import instacron
 
     instacron.main()
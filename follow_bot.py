@@ -3,15 +3,20 @@
 import atexit
 import random
 import sys
+import threading
 import time
 from contextlib import suppress
-from functools import wraps
+from functools import partial, wraps
 
 import attr
-from diskcache import Cache
 from huepy import bold, green
 from instabot import Bot, utils
 
+from session import Session
+from store import Snapshots, open_store
+from user_infos import UserInfos
+from vetting import Vetter
+
 
 def read_config(cfg="~/.config/instacron/config"):
     """Read the config.
@@ -74,22 +79,53 @@ def print_sleep(t):
     sys.stdout.write("\rDone sleeping!                ")
 
 
+def stored_list(fname):
+    """The `store.StoredList` that replaces the text file `fname`."""
+    return open_store().list(fname)
+
+
+def timed_list(fname):
+    """Like `stored_list`, for a file with "user_id,time" lines."""
+    return open_store().list(fname, timed=True)
+
+
 @attr.s
 class MyBot:
     bot = attr.ib()
-    friends = attr.ib(default="config/friends.txt", converter=utils.file)
-    tmp_following = attr.ib(default="config/tmp_following.txt", converter=utils.file)
-    unfollowed = attr.ib(default="config/unfollowed.txt", converter=utils.file)
-    to_follow = attr.ib(default="config/to_follow.txt", converter=utils.file)
+    friends = attr.ib(default="config/friends.txt", converter=stored_list)
+    tmp_following = attr.ib(default="config/tmp_following.txt", converter=timed_list)
+    unfollowed = attr.ib(default="config/unfollowed.txt", converter=stored_list)
+    to_follow = attr.ib(default="config/to_follow.txt", converter=stored_list)
     scraped_friends = attr.ib(
-        default="config/scraped_friends.txt", converter=utils.file
+        default="config/scraped_friends.txt", converter=stored_list
     )
-    n_followers = attr.ib(default="config/n_followers.txt", converter=utils.file)
-    user_infos = attr.ib(default="config/user_infos", converter=Cache)
-    skipped = attr.ib(default="skipped.txt", converter=utils.file)
+    n_followers = attr.ib(default="config/n_followers.txt", converter=stored_list)
+    user_infos = attr.ib(default="config/user_infos", converter=UserInfos)
+    skipped = attr.ib(default="skipped.txt", converter=stored_list)
+    snapshot_ttl = attr.ib(default=5 * 3600)
 
     def __attrs_post_init__(self):
         atexit.register(self.close)
+        # Held while using the bot, which the vetting threads use too
+        self.lock = threading.RLock()
+        self.candidates = Vetter(self._next_candidate, self._vet, lock=self.lock)
+        fetch_followers = partial(self._download, "followers")
+        fetch_following = partial(self._download, "following")
+        store = open_store()
+        self.followers = Snapshots(
+            store, "followers", fetch_followers, self.snapshot_ttl
+        )
+        self.following = Snapshots(
+            store, "following", fetch_following, self.snapshot_ttl
+        )
+
+    def _download(self, which):
+        """Download my followers or following and give them to instabot
+        too, so it does not download them again."""
+        user_ids = getattr(self.bot, f"get_user_{which}")(self.bot.user_id)
+        setattr(self.bot, f"_{which}", user_ids)
+        self.bot.last[f"updated_{which}"] = time.time()
+        return user_ids
 
     @property
     def scrapable_friends(self):
@@ -99,23 +135,26 @@ class MyBot:
     @print_starting
     def update_to_follow(self):
         """Update the 'to_follow' list recusively if it gets too short."""
-        if len(self.to_follow.list) < 1:
+        if len(self.to_follow) < 1:
             user_id = random.choice(self.scrapable_friends)
-            username = self.get_user_info(user_id)["username"]
-            print(f'Choosing "{user_id}", {username}.')
-            followers_of_friend = bot.get_user_followers(user_id)
-            potential_following = (
-                set(followers_of_friend)
-                - self.tmp_following.set
-                - self.friends.set
-                - self.bot.blacklist_file.set
-                - self.unfollowed.set
-            )
-            to_follow = self.to_follow.list + list(potential_following)
-            self.to_follow.save_list(to_follow)
+            info = self.get_user_info(user_id)
+            if info is None:  # Deleted or blocked me, nothing to scrape
+                print(f'Skipping "{user_id}", who does not exist anymore.')
+            else:
+                print(f'Choosing "{user_id}", {info["username"]}.')
+                followers_of_friend = self.bot.get_user_followers(user_id)
+                blacklist = self.bot.blacklist_file.set
+                potential_following = [
+                    u
+                    for u in set(followers_of_friend) - blacklist
+                    if u not in self.tmp_following
+                    and u not in self.friends
+                    and u not in self.unfollowed
+                ]
+                self.to_follow.extend(potential_following)
             self.scraped_friends.append(user_id)
         else:
-            return self.to_follow.list
+            return self.to_follow
         return self.update_to_follow()
 
     @stop_spamming
@@ -126,30 +165,33 @@ class MyBot:
             self.bot.api.unfollow(user_id)
 
         self.unfollowed.append(user_id)
+        self.tmp_following.remove(user_id)
 
-        with suppress(StopIteration):
-            to_remove = next(
-                x for x in self.tmp_following.list if x.split(",")[0] == user_id
-            )
-            self.tmp_following.remove(to_remove)
-
-        with suppress(ValueError):
-            self.bot.following.remove(user_id)
+        self.following.discard(user_id)
 
     @stop_spamming
     def follow(self, user_id, tmp_follow=True):
         self.bot.follow(user_id)
-        self.bot.following.append(user_id)
-        if tmp_follow and user_id not in self.skipped.list:
-            self.tmp_following.append(f"{user_id},{time.time()}")
+        self.following.add(user_id)
+        if tmp_follow and user_id not in self.skipped:
+            self.tmp_following.append(user_id, time.time())
         self.to_follow.remove(user_id)
 
-    def get_user_info(self, user_id):
-        if user_id not in self.user_infos:
-            print(f"{user_id} is not in the user_info database.")
-            user_info = self.bot.get_user_info(user_id)
-            self.user_infos.set(user_id, user_info, expire=86400 * 60, tag="user_info")
-        return self.user_infos[user_id]
+    def get_user_info(self, user_id, fields=()):
+        """The info of `user_id` (None if it does not exist), looked up
+        again if one of `fields` is outdated, see `user_infos.FIELD_EXPIRY`."""
+        return self.user_infos.get(user_id, self._fetch_user_info, fields)
+
+    def _fetch_user_info(self, user_id):
+        """The info of `user_id` from Instagram, None if it does not exist
+        or blocked me. Raises a RuntimeError when the lookup fails."""
+        api = self.bot.api
+        api.last_response = None  # It is not reset when a request fails
+        if api.get_username_info(user_id) and "user" in api.last_json:
+            return api.last_json["user"]
+        if api.last_response is not None and api.last_response.status_code == 404:
+            return None
+        raise RuntimeError(f"Looking up user {user_id} failed.")
 
     @stop_spamming
     def follow_random(self):
@@ -158,46 +200,37 @@ class MyBot:
         self.follow(user_id)
 
     @print_starting
-    def unfollow_if_max_following(self, max_following=1440):
-        """Automatically unfollow if 'max_following' is receached
-        but only 10 at the time."""
-        i = 0
-        while len(self.tmp_following.list) > max_following:
-            i += 1
-            self.unfollow(self.tmp_following.list[0].split(",")[0])
-            if i > 10:
-                break
+    def unfollow_if_max_following(self, max_following=1440, max_unfollows=10):
+        """Automatically unfollow the oldest follows if 'max_following'
+        is receached but only 'max_unfollows' at the time."""
+        n = min(len(self.tmp_following) - max_following, max_unfollows)
+        if n > 0:
+            for user_id, _ in self.tmp_following.by_time(n):
+                self.unfollow(user_id)
 
     @print_starting
-    def unfollow_after_time(self, days_max=4):
+    def unfollow_after_time(self, days_max=4, max_unfollows=10):
         """Automatically unfollow if 'days_max' is receached
-        but only 10 at the time."""
-        user_id, t_follow = self.tmp_following.list[0].split(",")
-        i = 0
-        while time.time() - float(t_follow) > 86400 * days_max:
-            i += 1
+        but only 'max_unfollows' at the time."""
+        t_max = time.time() - 86400 * days_max
+        for user_id, _ in self.tmp_following.older_than(t_max, max_unfollows):
             self.unfollow(user_id)
-            user_id, t_follow = self.tmp_following.list[0].split(",")
-            if i > 10:
-                break
 
     @print_starting
     def unfollow_followers_that_are_not_friends(self):
         """XXX: what does this do again?"""
-        followers = set(self.bot.followers)
-        non_friends_followers = followers - self.friends.set
-        followings = set(self.bot.following)
-        unfollows = [x for x in followings if x in non_friends_followers]
+        non_friends_followers = self.followers.set - self.friends.set
+        unfollows = [x for x in self.following.set if x in non_friends_followers]
         for u in unfollows:
-            if u not in self.unfollowed.list:
+            if u not in self.unfollowed:
                 self.unfollow(u)
 
     @stop_spamming
     @print_starting
     def unfollow_all_non_friends(self):
         """Unfollow EVERYONE that is not in 'self.friends.'"""
-        followings = set(self.bot.following)
-        unfollows = [x for x in followings if x not in self.friends.list]
+        friends = self.friends.set
+        unfollows = [x for x in self.following.set if x not in friends]
         print(f'\nGoing to unfollow {len(unfollows)} "friends".')
         for u in unfollows:
             self.unfollow(u)
@@ -206,15 +239,17 @@ class MyBot:
     @print_starting
     def unfollow_accepted_unreturned_requests(self, max_hours=1):
         """Unfollow if a private_user accepted my request but doesn't follow back."""
-        tmp_following, times = zip(*[x.split(",") for x in c.tmp_following.list])
         accepted_followings = [
             (u, t)
-            for u, t in zip(tmp_following, times)
-            if u in self.bot.following and u not in self.friends.set
+            for u, t in self.tmp_following.by_time()
+            if u in self.following and u not in self.friends
         ]
+        self.user_infos.prefetch(
+            [u for u, _ in accepted_followings], fields=["is_private"]
+        )
         for u, t in accepted_followings:
-            info = self.get_user_info(u)
             try:
+                info = self.get_user_info(u, ["is_private"])
                 if info["is_private"] and time.time() - t > 3600 * float(max_hours):
                     print(
                         f'\nUser {info["username"]} is private and accepted my '
@@ -230,10 +265,12 @@ class MyBot:
         """Like media from people that are in 'self.to_follow' and
         then remove them from the list."""
         user_id = self.to_follow.random()
-        while self.get_user_info(user_id)["is_private"]:
+        info = self.get_user_info(user_id, ["is_private"])
+        while info is None or info["is_private"]:
             user_id = self.to_follow.random()
+            info = self.get_user_info(user_id, ["is_private"])
         n = random.randint(2, 4)
-        username = self.get_user_info(user_id)["username"]
+        username = info["username"]
         print(f"Liking {n} medias from `{username}`.")
         medias = self.bot.get_user_medias(user_id)
         self.bot.like_medias(random.sample(medias, n))
@@ -242,47 +279,63 @@ class MyBot:
     @print_starting
     @stop_spamming
     def like_media_from_nonfollowers(self):
-        user_ids = list(
-            set(self.bot.following) - set(self.bot.followers) - self.friends.set
-        )
-        user_id = random.choice(user_ids)
+        user_ids = list(self.following.set - self.followers.set - self.friends.set)
+        random.shuffle(user_ids)
+        for user_id in user_ids:
+            info = self.get_user_info(user_id)
+            if info is not None:
+                break
+            self.following.discard(user_id)  # Does not exist anymore
+        else:
+            print("Found no non-follower to like medias from.")
+            return
         n = random.randint(2, 4)
-        username = self.get_user_info(user_id)["username"]
+        username = info["username"]
         print(f"Liking {n} medias from `{username}`.")
         medias = self.bot.get_user_medias(user_id)
         picked_medias = random.sample(medias, min(n, len(medias)))
         self.bot.like_medias(picked_medias)
 
+    def _next_candidate(self):
+        if len(self.to_follow) < 1:
+            self.update_to_follow()
+        return self.to_follow.random() if len(self.to_follow) else None
+
+    def _vet(self, user_id):
+        """The medias of `user_id` if it is worth following, otherwise it
+        is removed from 'self.to_follow'."""
+        info = self.get_user_info(user_id, ["is_private"])
+        medias = None
+        if info is not None and not info["is_private"] and self.bot.check_user(user_id):
+            medias = self.bot.get_user_medias(user_id)
+        if medias and self.lastest_post(medias) < 21:  # days
+            return medias
+        self.to_follow.remove(user_id)
+        return None
+
     @print_starting
     @stop_spamming
     def follow_and_like(self):
-        self.update_to_follow()
+        """Follow a user from 'self.to_follow' that has recent posts (see
+        `_vet`) and like some of them."""
         if self.bot.reached_limit("likes"):
             print(green(bold(f"\nOut of likes, pausing for 10 minutes.")))
-            self.print_sleep(600)
+            print_sleep(600)
             return
-        user_id = self.to_follow.random()
-        busy = True
-        while busy:
-            if self.get_user_info(user_id)["is_private"] or not self.bot.check_user(
-                user_id
-            ):
-                user_id = self.to_follow.random()
-                self.to_follow.remove(user_id)
-            else:
-                busy = False
-
-        username = self.get_user_info(user_id)["username"]
-        medias = self.bot.get_user_medias(user_id)
-        self.to_follow.remove(user_id)
-        if medias and self.lastest_post(medias) < 21:  # days
-            n = min(random.randint(4, 10), len(medias))
-            print(f"Liking {n} medias from `{username}`.")
-            self.bot.like_medias(random.sample(medias, n))
-            self.follow(user_id, tmp_follow=True)
-        else:
-            # Abandon user and call self recusively.
-            self.follow_and_like()
+        candidate = self.candidates.pop()
+        if candidate is None:
+            print("Found no user to follow.")
+            return
+        user_id, medias = candidate
+        info = self.get_user_info(user_id)
+        if info is None:  # Gone since it was vetted
+            self.to_follow.remove(user_id)
+            return
+        username = info["username"]
+        n = min(random.randint(4, 10), len(medias))
+        print(f"Liking {n} medias from `{username}`.")
+        self.bot.like_medias(random.sample(medias, n))
+        self.follow(user_id, tmp_follow=True)
 
     def lastest_post(self, medias):
         media = self.bot.get_media_info(medias[0])
@@ -294,19 +347,23 @@ class MyBot:
     @print_starting
     def track_followers(self):
         try:
-            n_followers_old = int(self.n_followers.list[-1].split(",")[0])
-        except IndexError:
+            [(last, _)] = self.n_followers.by_time(1, reverse=True)
+            n_followers_old = int(last.split(",")[0])
+        except ValueError:
             n_followers_old = 0
-        n_followers = len(self.bot.followers)
+        n_followers = len(self.followers)
         if n_followers_old != n_followers:
             self.n_followers.append(f"{n_followers},{time.time()}")
+            new, lost = self.followers.diff()
+            print(
+                f"{len(new)} new and {len(lost)} lost followers since the last check."
+            )
 
     @print_starting
     def unfollow_failed_unfollows(self):
         """This will unfollow users that were already supposed to be
         unfollowed but something has gone wrong. Maximum 15 unfollows per call."""
-        tmp_following = [u.split(",")[0] for u in self.tmp_following.list]
-        users = set(bot.following) - set(tmp_following) - self.friends.set
+        users = self.following.set - self.tmp_following.set - self.friends.set
         manually_followed = set(users) - self.unfollowed.set
         to_unfollow = set(users) - manually_followed
         print(f"Going to unfollow {len(to_unfollow)} users")
@@ -318,18 +375,21 @@ class MyBot:
     def refollow_friends(self):
         """"Refollow everyone in 'self.friends' because a bug sometimes causes
         accidental unfollows."""
-        for u in self.friends.list:
-            if u not in self.bot.following:
+        for u in self.friends:
+            if u not in self.following:
                 self.follow(u, tmp_follow=False)
 
     def close(self):
+        self.candidates.stop()
         print("Closing user_infos database.")
+        print(self.user_infos.report())
         self.user_infos.close()
 
 
 if __name__ == "__main__":
     bot = Bot(max_following_to_followers_ratio=20, max_following_to_follow=5000)
-    bot.api.login(**read_config(), use_cookie=False)
+    session = Session(**read_config(), bot=bot)
+    session.ensure()
     c = MyBot(bot)
     # c.refollow_friends()
     funcs = [
@@ -356,16 +416,15 @@ if __name__ == "__main__":
         n_per_day = 200
         n_seconds = 86400 / n_per_day
         t_start = time.time()
-        if random.random() < n_seconds / (5 * 3600):
-            # Invalidate the cache every ~5 hours
-            c.bot._followers = None
-        c.track_followers()
-        random.shuffle(funcs)
-        for f in funcs:
-            try:
-                f()
-            except Exception as e:
-                print(str(e))
+        with c.lock:  # The candidates are vetted while sleeping
+            session.ensure()
+            c.track_followers()
+            random.shuffle(funcs)
+            for f in funcs:
+                try:
+                    f()
+                except Exception as e:
+                    print(str(e))
 
         wait_for = n_seconds - (time.time() - t_start)
         print_sleep(max(random.gauss(wait_for, 60), 0))
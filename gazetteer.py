@@ -0,0 +1,157 @@
+"""Offline reverse geocoding with a GeoNames gazetteer.
+
+Download for example `cities15000.zip` from
+http://download.geonames.org/export/dump/ and unzip it in
+`~/.config/instacron/`, after which `instacron` will not use
+OpenStreetMap to find the location of a photo anymore.
+"""
+
+import os.path
+from functools import lru_cache
+
+import numpy as np
+import pycountry
+
+# Columns of the GeoNames "geoname" table
+NAME, LATITUDE, LONGITUDE, COUNTRY_CODE = 1, 4, 5, 8
+CELLS_PER_DEGREE = 1
+MAX_NAME_BYTES = 64
+EARTH_RADIUS = 6371  # km
+KM_PER_DEGREE = 2 * np.pi * EARTH_RADIUS / 360
+
+DTYPE = [
+    ("lat", "f4"),
+    ("long", "f4"),
+    ("cell", "i4"),
+    ("name", f"S{MAX_NAME_BYTES}"),
+    ("country_code", "S2"),
+]
+
+
+def _cell(lat, long_):
+    """Index of the grid cell that contains a location."""
+    i = np.floor((np.asarray(lat) + 90) * CELLS_PER_DEGREE).astype(np.int64)
+    j = np.floor((np.asarray(long_) + 180) * CELLS_PER_DEGREE).astype(np.int64)
+    return i * 360 * CELLS_PER_DEGREE + j % (360 * CELLS_PER_DEGREE)
+
+
+def _parse(fname):
+    rows = []
+    with open(fname, encoding="utf-8") as f:
+        for line in f:
+            cols = line.split("\t")
+            name = cols[NAME].encode("utf-8")[:MAX_NAME_BYTES]
+            rows.append((cols[LATITUDE], cols[LONGITUDE], name, cols[COUNTRY_CODE]))
+    lat, long_, name, country_code = zip(*rows)
+    places = np.zeros(len(rows), dtype=DTYPE)
+    places["lat"] = np.array(lat, dtype=float)
+    places["long"] = np.array(long_, dtype=float)
+    places["cell"] = _cell(places["lat"], places["long"])
+    places["name"] = name
+    places["country_code"] = country_code
+    places.sort(order="cell")
+    return places
+
+
+def _haversine(lat1, long1, lat2, long2):
+    lat1, long1, lat2, long2 = map(np.radians, (lat1, long1, lat2, long2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def country_name(country_code):
+    """The name of a country as used in `continents.continents`."""
+    country = pycountry.countries.get(alpha_2=country_code.upper())
+    if country is not None:
+        return getattr(country, "common_name", country.name)
+
+
+class Gazetteer:
+    """Nearest-place lookups in a GeoNames gazetteer.
+
+    The places are sorted by the grid cell they are in, so the
+    candidates for a query are found with a binary search. The parsed
+    gazetteer is stored next to the text file as a `.npy` file, which is
+    memory-mapped on later runs.
+    """
+
+    def __init__(self, fname, max_rings=10):
+        self.max_rings = max_rings
+        cache = fname + ".npy"
+        outdated = (
+            not os.path.exists(cache)
+            or os.path.getmtime(cache) < os.path.getmtime(fname)
+        )
+        if outdated:
+            np.save(cache, _parse(fname))
+        self.places = np.load(cache, mmap_mode="r")
+        self.cells = np.ascontiguousarray(self.places["cell"])
+
+    def _area(self, lat, long_, rings):
+        """The rows and the ranges of columns of the cells within `rings`
+        cells of a location. When the rows reach a pole, these are all
+        the columns, since the cells across the pole are close too."""
+        n_rows, n_cols = 180 * CELLS_PER_DEGREE, 360 * CELLS_PER_DEGREE
+        i, j = divmod(int(_cell(lat, long_)), n_cols)
+        rows = np.arange(max(i - rings, 0), min(i + rings + 1, n_rows))
+        if 2 * rings + 1 >= n_cols or rows[0] == 0 or rows[-1] == n_rows - 1:
+            ranges = [(0, n_cols)]
+        elif j - rings < 0:
+            ranges = [(0, j + rings + 1), (j - rings + n_cols, n_cols)]
+        elif j + rings >= n_cols:
+            ranges = [(j - rings, n_cols), (0, j + rings + 1 - n_cols)]
+        else:
+            ranges = [(j - rings, j + rings + 1)]
+        return rows, ranges
+
+    def _candidates(self, rows, ranges):
+        """Indices of the places in the cells of `_area`."""
+        n_cols = 360 * CELLS_PER_DEGREE
+        bounds = np.array([rows * n_cols + start for start, end in ranges])
+        ends = np.array([rows * n_cols + end for start, end in ranges])
+        lo = np.searchsorted(self.cells, bounds.ravel())
+        hi = np.searchsorted(self.cells, ends.ravel())
+        return np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])
+
+    def nearest(self, lat, long_):
+        """The place closest to a location, or None if there is nothing
+        within `max_rings` grid cells. If the closest place is further
+        away than that, the closest one in those cells is returned."""
+        for rings in range(1, self.max_rings + 1):
+            rows, ranges = self._area(lat, long_, rings)
+            candidates = self._candidates(rows, ranges)
+            if not len(candidates):
+                continue
+            places = self.places[candidates]
+            distance = _haversine(lat, long_, places["lat"], places["long"])
+            best = np.argmin(distance)
+            # Distance to the closest point outside of the searched cells,
+            # which are `rings` cells away in latitude and (unless they go
+            # around the globe) in longitude at the highest latitude
+            searched = rings / CELLS_PER_DEGREE * KM_PER_DEGREE
+            if ranges != [(0, 360 * CELLS_PER_DEGREE)]:
+                edges = [rows[0] / CELLS_PER_DEGREE, (rows[-1] + 1) / CELLS_PER_DEGREE]
+                max_lat = max(abs(edge - 90) for edge in edges)
+                searched = _haversine(max_lat, 0, max_lat, rings / CELLS_PER_DEGREE)
+            if distance[best] <= searched or rings == self.max_rings:
+                return places[best]
+
+    def reverse(self, lat, long_):
+        """The fields of an `instacron.Address` for the place closest
+        to a location."""
+        place = self.nearest(lat, long_)
+        if place is None:
+            return None
+        city = place["name"].decode("utf-8", errors="ignore")
+        country_code = place["country_code"].decode()
+        country = country_name(country_code)
+        address = f"{city}, {country}" if country else city
+        return address, country, country_code.lower(), city
+
+
+@lru_cache(maxsize=None)
+def load(fname):
+    return Gazetteer(os.path.expanduser(fname))
@@ -2,29 +2,43 @@
 # -*- coding: utf-8 -*-
 
 import json
+import math
 import os.path
 import random
 import tempfile
 import time
-from collections import Counter
-from glob import glob
-
-import dateutil.parser
-import emoji
-import exifread
-import geocoder
-import instabot
-import numpy as np
-import parse
-import PIL.Image
-import pycountry
-import requests
-import wikiquotes
+from collections import namedtuple
+from functools import lru_cache
+
 from termcolor import colored
 
+import quotes
+import session
+import uploadlog
+from catalog import Catalog
 from continents import continents
 from hashtags import EXTRA_HASHTAGS
 
+GEOCODE_CACHE = "~/.cache/instacron/geocode"
+GAZETTEER = "~/.config/instacron/cities15000.txt"
+QUOTES = "~/.cache/instacron/quotes.json"
+ANALYSIS_SIZE = 512  # Minimal size of the thumbnail the crop is searched on
+INSTAGRAM_WIDTH = 1080
+# Most bytes of decoded pixels to hold at once. Searching the crop takes
+# about 6 kB more per column of the (at least ANALYSIS_SIZE) thumbnail.
+MEMORY_LIMIT = 2 ** 28
+QUOTE_API = "http://api.forismatic.com/api/1.0/?method=getQuote&format=json&lang=en"
+PEOPLE = ["Hunter S. Thompson", "Albert Einstein", "Charles Bukowski"]
+EMOJI_THEMES = {
+    "nature": "tree leaf flower blossom mountain volcano sun cloud rain snow wave "
+    "palm cactus herb seedling rose tulip maple mushroom rainbow sunflower "
+    "sunrise sunset snowflake".split(),
+    "travel": "airplane train ship car bus map globe luggage camera compass tent "
+    "camping beach island bridge station rocket sailboat ferry passport".split(),
+}
+
+Address = namedtuple("Address", ["address", "country", "country_code", "city"])
+
 
 def read_config(cfg="~/.config/instacron/config"):
     """Read the config.
@@ -54,63 +68,101 @@ def read_config(cfg="~/.config/instacron/config"):
     return {"username": user, "password": pw}
 
 
+class _CountingReader:
+    """File wrapper that counts the number of bytes read."""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+
+class PhotoMetadata:
+    """The EXIF tags, size and format of a photo.
+
+    Only the header of the file is read, and only once, see
+    `read_metadata`. The size and format are read when they are first
+    needed, so a caption does not need PIL. The number of bytes that
+    were needed is stored in `bytes_read`."""
+
+    def __init__(self, fname):
+        import exifread
+
+        self.fname = fname
+        with open(fname, "rb") as f:
+            reader = _CountingReader(f)
+            self.tags = exifread.process_file(reader, details=False)
+        self.bytes_read = reader.bytes_read
+        self._size_and_format = None
+
+    def _read_size_and_format(self):
+        if self._size_and_format is None:
+            with open(self.fname, "rb") as f:
+                reader = _CountingReader(f)
+                img = open_image(reader)
+                self._size_and_format = img.size, img.format
+            self.bytes_read += reader.bytes_read
+        return self._size_and_format
+
+    @property
+    def size(self):
+        return self._read_size_and_format()[0]
+
+    @property
+    def format(self):
+        return self._read_size_and_format()[1]
+
+
+def read_metadata(fname):
+    """The `PhotoMetadata` of a photo, shared by all steps of a post."""
+    return _read_metadata(fname, os.path.getmtime(fname))
+
+
+@lru_cache(maxsize=32)
+def _read_metadata(fname, mtime):
+    # `mtime` is only there to not return the metadata of a replaced file
+    return PhotoMetadata(fname)
+
+
 def correct_ratio(photo):
-    from instabot.api.api_photo import compatible_aspect_ratio, get_image_size
+    from instabot.api.api_photo import compatible_aspect_ratio
 
-    return compatible_aspect_ratio(get_image_size(photo))
+    return compatible_aspect_ratio(read_metadata(photo).size)
 
 
-def get_all_photos(uploaded_file, photo_folder):
-    with open(uploaded_file, encoding="utf-8") as f:
-        uploaded = [line.rstrip() for line in f]
-    photos = glob(os.path.join(photo_folder, "*.jpg"))
-    photos = photos_to_upload(photos, uploaded)
-    return photos
+def get_upload_log(folder):
+    """The `uploadlog.UploadLog` in `folder`, created from `uploaded.txt` if it
+    does not exist yet."""
+    fname = os.path.join(folder, "uploaded.log")
+    uploaded_file = os.path.join(folder, "uploaded.txt")
+    if not os.path.exists(fname) and os.path.exists(uploaded_file):
+        return uploadlog.migrate(uploaded_file, fname)
+    return uploadlog.UploadLog(fname)
 
 
-def choose_random_photo(uploaded_file, photo_folder):
-    photos = get_all_photos(uploaded_file, photo_folder)
-    photo = random.choice(photos)  # choose a random photo
-    return photo
+def get_catalog(upload_log, photo_folder, shared_metadata=None):
+    fname = os.path.join(os.path.dirname(upload_log.fname), "catalog.sqlite")
+    return Catalog(fname, photo_folder, upload_log, shared_metadata)
 
 
-def photos_to_upload(photos, uploaded):
-    """Check which photos it can upload.
+def get_all_photos(upload_log, photo_folder):
+    """The photos that have been uploaded the least.
 
     When all pictures in the photo folder have been uploaded
     it starts to upload old pictures again."""
+    return get_catalog(upload_log, photo_folder).least_uploaded()
 
-    # Remove files from `uploaded` that are not present
-    # in `photos` any more.
-    photos_base = [os.path.basename(p) for p in photos]
-    uploaded = [p for p in uploaded if p in photos_base]
-
-    if not uploaded:
-        return photos
-
-    # Create a counter
-    counter = Counter(uploaded)
-    n_counts = sorted(set(counter.values()))
-    count_min = min(counter.values())
-
-    if len(uploaded) >= count_min * len(photos):
-        # Photos all have been uploaded already
-        if len(n_counts) == 1:
-            # Every photo is uploaded the same amount of times
-            _photos = list(counter.keys())
-        elif len(n_counts) > 1:
-            # There are some photos uploaded N times, while other are
-            # uploaded N+1 times.
-
-            # Remove the photos with the lowest count and select
-            # the images with the second lowest count.
-            _photos = list(
-                {photo for photo, count in counter.items() if count == count_min}
-            )
-    else:
-        # Not all photos have been uploaded yet
-        _photos = [p for p in photos if os.path.basename(p) not in uploaded]
-    return _photos
+
+def choose_random_photo(upload_log, photo_folder):
+    catalog = get_catalog(upload_log, photo_folder)
+    return catalog.random_least_uploaded()
 
 
 def get_lat_long_from_exif(exif):
@@ -127,20 +179,85 @@ def get_lat_long_from_exif(exif):
     return lat, long_
 
 
+def _reverse_geocode_osm(lat, long_):
+    import geocoder
+
+    for i in range(10):
+        r = geocoder.osm([lat, long_], method="reverse").current_result
+        if r is not None:
+            return Address(r.address, r.country, r.country_code, r.city)
+        time.sleep(0.1)
+
+
+def _reverse_geocode_offline(lat, long_):
+    import gazetteer
+
+    place = gazetteer.load(GAZETTEER).reverse(lat, long_)
+    if place is not None:
+        return Address(*place)
+
+
+@lru_cache(maxsize=None)
+def geocode_cache(directory=GEOCODE_CACHE, size_limit=2 ** 26):
+    """The on-disk cache used by `reverse_geocode`.
+
+    It evicts the least recently used addresses when it grows beyond
+    `size_limit` bytes and counts its hits and misses, see `Cache.stats`."""
+    from diskcache import Cache
+
+    return Cache(
+        os.path.expanduser(directory),
+        size_limit=size_limit,
+        eviction_policy="least-recently-used",
+        statistics=True,
+    )
+
+
+def reverse_geocode(
+    lat, long_, precision=3, expire=86400 * 365, cache=None, geocode=None
+):
+    """Look up the address of a location, with an on-disk cache.
+
+    The cache key is the name of the geocoder and the location rounded to
+    `precision` decimals (3 is about 100 m), so photos taken at the same
+    spot cost a single request. `geocode(lat, long_)` returns an `Address`
+    and defaults to the offline `gazetteer` if `GAZETTEER` exists and to
+    OpenStreetMap otherwise."""
+    if cache is None:
+        cache = geocode_cache()
+    if geocode is None:
+        offline = os.path.exists(os.path.expanduser(GAZETTEER))
+        geocode = _reverse_geocode_offline if offline else _reverse_geocode_osm
+    # The gazetteer only knows the nearest city, OSM the street address
+    key = (geocode.__name__, round(lat, precision), round(long_, precision))
+    address = cache.get(key)
+    if address is not None:
+        return Address(*address)
+    address = geocode(lat, long_)
+    if address is not None:
+        # Store a plain tuple, so it unpickles no matter how we were imported
+        cache.set(key, tuple(address), expire=expire)
+    return address
+
+
+def _lat_long_and_time_from_exif(fname):
+    import dateutil.parser
+
+    tags = read_metadata(fname).tags
+    try:
+        lat_long = get_lat_long_from_exif(tags)
+    except Exception:
+        lat_long = None
+    date = dateutil.parser.parse(tags["Image DateTime"].printable)
+    return lat_long, date
+
+
 def _location_and_time_from_exif(fname):
-    with open(fname, "rb") as f:
-        tags = exifread.process_file(f)
+    lat_long, date = _lat_long_and_time_from_exif(fname)
     try:
-        lat, long_ = get_lat_long_from_exif(tags)
-        for i in range(10):
-            r = geocoder.osm([lat, long_], method="reverse").current_result
-            if r is not None:
-                break
-            time.sleep(0.1)
-        address = r
+        address = reverse_geocode(*lat_long)
     except Exception:
         address = None
-    date = dateutil.parser.parse(tags["Image DateTime"].printable)
     return address, date
 
 
@@ -159,6 +276,9 @@ def get_place_hashtags(city, country):
 
 
 def _location_caption_from_fname(photo):
+    import dateutil.parser
+    import parse
+
     templates = [
         "{i}-{date}-{country}-{city}-{rest}.jpg",
         "{i}-{date}-{country}-{city}.jpg",
@@ -171,20 +291,25 @@ def _location_caption_from_fname(photo):
             date = dateutil.parser.parse(d["date"])
             country = d["country"]
             city = d["city"]
-            flag = emoji.emojize(f":{country.replace(' ', '_')}:")
             city_str = f", {city}" if city else ""
-            caption = f"   Taken in {country}{city_str} {flag} on {date:%d %B %Y}."
+            caption = f"   Taken in {country}{city_str} {flag(country)}"
+            caption += f" on {date:%d %B %Y}."
             hashtags = get_place_hashtags(country, city)
             return caption, hashtags
 
 
 def _location_caption_from_GPS(photo):
-    address, date = _location_and_time_from_exif(photo)
+    return _location_caption_from_address(*_location_and_time_from_exif(photo))
+
+
+def _location_caption_from_address(address, date):
+    import emoji
+    import pycountry
+
     try:
         country_code = address.country_code.upper()
         country = pycountry.countries.get(alpha_2=country_code).name
-        flag = emoji.emojize(f":{country.replace(' ', '_')}:")
-        caption_part = f"in {address.address}" + flag
+        caption_part = f"in {address.address}" + flag(country)
     except Exception as e:
         print(e)
         caption_part = "somewhere" + emoji.emojize(":world_map:")
@@ -206,42 +331,100 @@ def get_location_caption_and_hashtags(photo):
         return _location_caption_from_GPS(photo)
 
 
-def _get_random_quote():
-    response = requests.get(
-        "http://api.forismatic.com/api/1.0/?method=getQuote&format=json&lang=en"
-    )
+def _get_random_quote(url=QUOTE_API):
+    import requests
+
+    response = requests.get(url, timeout=10)
     response = json.loads(response.text)
     quote = response["quoteText"]
     author = response["quoteAuthor"]  # noqa: F841
     return quote
 
 
+def _fetch_quote(person):
+    import wikiquotes
+
+    if person == quotes.GENERIC:
+        return _get_random_quote()
+    return wikiquotes.random_quote(person, "English")
+
+
+@lru_cache(maxsize=None)
+def quote_pool(fname=QUOTES):
+    return quotes.QuotePool(fname, _fetch_quote)
+
+
 def get_random_quote(from_person=None):
-    if from_person is not None:
-        person = random.choice(from_person)
-        return wikiquotes.random_quote(person, "English")
+    """A quote by a random person out of `from_person`, or a generic one.
+
+    The quote comes from the `quote_pool`, so this never waits for the
+    network. Returns an empty string if the pools are empty, which they
+    are until they are first filled (in the background, or with
+    `--fill_quotes`)."""
+    pool = quote_pool()
+    keys = [random.choice(from_person)] if from_person else []
+    for key in keys + [quotes.GENERIC]:
+        quote = pool.pop(key)
+        if quote is not None:
+            return quote
+    print(
+        "Warning: the quote pools are empty, so the caption has no quote."
+        " Fill them with `python instacron.py --fill_quotes`."
+    )
+    return ""
 
-    for _ in range(10):
-        try:
-            return _get_random_quote()
-        except Exception:
-            time.sleep(1)
-            pass
 
+@lru_cache(maxsize=None)
+def emoji_table(theme=None):
+    """All single-codepoint emojis that are not a flag, or only the ones
+    whose name has a word from `EMOJI_THEMES[theme]` (so "rain" is not
+    the train)."""
+    import emoji
 
-def random_emoji():
-    # Don't return a random flag (hence the `islower`)
-    emojis = [
+    words = set(EMOJI_THEMES[theme]) if theme is not None else None
+    return tuple(
         e
-        for e, unicode in emoji.UNICODE_EMOJI.items()
-        if unicode[1].islower() and len(e) == 1
-    ]
-    return random.choice(emojis)
+        for e, name in emoji.UNICODE_EMOJI.items()
+        # Flags are the capitalized country names (hence the `islower`)
+        if name[1].islower()
+        and len(e) == 1
+        and (words is None or _name_words(name) & words)
+    )
+
+
+def _name_words(name):
+    """The words of an emoji name like ":snow-capped_mountain:"."""
+    return set(name.strip(":").replace("-", "_").split("_"))
+
+
+def random_emoji(theme=None):
+    return random.choice(emoji_table(theme))
+
+
+def _is_flag(e):
+    return all("\U0001F1E6" <= c <= "\U0001F1FF" for c in e)
+
+
+@lru_cache(maxsize=None)
+def _flags():
+    import emoji
+
+    return {
+        name[1:-1].replace("_", " "): e
+        for e, name in emoji.UNICODE_EMOJI.items()
+        if _is_flag(e)
+    }
+
+
+def flag(country):
+    """The flag emoji of a country, like `emoji.emojize(":Peru:")`."""
+    return _flags().get(country, f":{country.replace(' ', '_')}:")
 
 
 def get_camera_settings(fname):
-    with open(fname, "rb") as f:
-        tags = exifread.process_file(f)
+    import emoji
+
+    tags = read_metadata(fname).tags
     brand = tags["Image Make"].printable
     model = tags["Image Model"].printable
     lens = tags["EXIF LensModel"].printable
@@ -255,13 +438,19 @@ def get_camera_settings(fname):
 
 def get_caption(fname):
     location_caption, location_hashtags = get_location_caption_and_hashtags(fname)
+    camera_settings = get_camera_settings(fname)
+    return compose_caption(location_caption, location_hashtags, camera_settings)
+
+
+def compose_caption(location_caption, location_hashtags, camera_settings):
+    import emoji
 
     caption = random_emoji() + random_emoji() + location_caption
 
     # Advertize the Python script
     caption += "#instacron " + emoji.emojize(":snake:") + " www.instacron.nijho.lt"
     spacer = "\n" + 3 * ".\n"
-    caption += spacer + get_camera_settings(fname) + spacer
+    caption += spacer + camera_settings + spacer
 
     extra_hashtags = EXTRA_HASHTAGS.copy()
     random.shuffle(extra_hashtags)
@@ -273,68 +462,613 @@ def get_caption(fname):
     return caption
 
 
-def prepare_and_fix_photo(photo):
-    with open(photo, "rb") as f:
-        img = PIL.Image.open(f)
-        img = strip_exif(img)
-        if not correct_ratio(photo):
-            img = crop_maximize_entropy(img)
-        photo = os.path.join(tempfile.gettempdir(), "instacron.jpg")
-        img.save(photo)
-    return photo
+def find_crop_box(photo, score="entropy", max_bytes=MEMORY_LIMIT):
+    """The crop that `prepare_and_fix_photo` makes, None if the aspect
+    ratio is already fine. `score` is one of the `CROP_SCORES`."""
+    if correct_ratio(photo):
+        return None
+    return crop_box_multiscale(photo, score=score, max_bytes=max_bytes)
 
 
-def _entropy(data):
-    """Calculate the entropy of an image"""
-    hist = np.array(PIL.Image.fromarray(data).histogram())
-    hist = hist / hist.sum()
-    hist = hist[hist != 0]
-    return -np.sum(hist * np.log2(hist))
+def prepare_and_fix_photo(photo, box=None, score="entropy", max_bytes=MEMORY_LIMIT):
+    """Strip the metadata and crop the photo to a compatible aspect ratio.
 
+    The crop is found with `find_crop_box` (using the crop `score`)
+    unless `box` is passed. Unless `jpegtran` can crop it losslessly,
+    the photo is also shrunk to the width that Instagram shows, see
+    `crop_and_resize`. At most `max_bytes` of pixels are decoded at a
+    time.
 
-def crop(x, y, data, w, h):
-    x = int(x)
-    y = int(y)
-    return data[y : y + h, x : x + w]
+    Returns the name of a new temporary file (so that posts of several
+    accounts do not overwrite each other's), which the caller removes."""
+    fd, fname = tempfile.mkstemp(prefix="instacron-", suffix=".jpg")
+    os.close(fd)
+    try:
+        _prepare_and_fix_photo(photo, fname, box, score, max_bytes)
+    except BaseException:
+        os.remove(fname)
+        raise
+    return fname
+
+
+def _prepare_and_fix_photo(photo, fname, box, score, max_bytes):
+    is_jpeg = read_metadata(photo).format == "JPEG"
+    if is_jpeg and correct_ratio(photo):
+        # Only the metadata needs to go, so skip the re-encoding.
+        with open(photo, "rb") as f, open(fname, "wb") as out:
+            out.write(strip_exif_from_jpeg(f.read()))
+        return
+    with open(photo, "rb") as f:
+        img = open_image(f)
+        if correct_ratio(photo):
+            box = (0, 0, *img.size)
+        else:
+            if box is None:
+                box = find_crop_box(photo, score, max_bytes)
+            if is_jpeg and jpegtran_crop(photo, fname, box):
+                return
+        img = crop_and_resize(img, box, max_bytes=max_bytes)
+        img.save(fname)
 
 
-def crop_maximize_entropy(img, min_ratio=4 / 5, max_ratio=90 / 47):
-    from scipy.optimize import minimize_scalar
+def open_image(f):
+    """`PIL.Image.open` without PIL's limit on the number of pixels, which
+    would refuse large panoramas. The memory that decoding takes is
+    limited with `limit_decoding` instead."""
+    import PIL.Image
+
+    PIL.Image.MAX_IMAGE_PIXELS = None
+    return PIL.Image.open(f)
 
-    w, h = img.size
-    data = np.array(img)
-    ratio = w / h
-    if ratio > max_ratio:  # Too wide
-        w_max = int(max_ratio * h)
 
-        def _crop(x):
-            return crop(x, y=0, data=data, w=w_max, h=h)
+def limit_decoding(img, size, max_bytes=MEMORY_LIMIT):
+    """Let a JPEG `img` decode at the smallest of the scales 1, 1/2, 1/4
+    and 1/8 that is at least `size`, or at a smaller one when that
+    takes more than `max_bytes`.
 
-        xy_max = w - w_max
+    Raises a ValueError when `img` cannot be decoded in `max_bytes`."""
+    w, h = img.size
+    n_bands = len(img.getbands())
+    if img.format == "JPEG":
+        fits = [
+            s
+            for s in (1, 2, 4, 8)
+            if math.ceil(w / s) * math.ceil(h / s) * n_bands <= max_bytes
+        ]
+        if fits:
+            large_enough = [s for s in fits if w // s >= size[0] and h // s >= size[1]]
+            s = max(large_enough) if large_enough else min(fits)
+            img.draft(img.mode, (w // s, h // s))
+            return
+    elif w * h * n_bands <= max_bytes:
+        return
+    raise ValueError(f"Decoding {w}x{h} pixels takes more than {max_bytes} bytes.")
+
+
+def crop_and_resize(img, box, width=INSTAGRAM_WIDTH, max_bytes=MEMORY_LIMIT):
+    """Crop `img` to `box` and shrink it to at most `width` pixels wide,
+    which is all that Instagram shows, without its metadata.
+
+    The crop and the resize are done together, and a JPEG that is much
+    larger than needed (or than `max_bytes`) is decoded at 1/2, 1/4 or
+    1/8 of its size."""
+    import PIL.Image
+
+    left, upper, right, lower = box
+    scale = min(width / (right - left), 1)
+    w, h = img.size
+    limit_decoding(img, (int(w * scale), int(h * scale)), max_bytes)
+    size = (round((right - left) * scale), round((lower - upper) * scale))
+    if img.size == (w, h) and scale == 1:
+        return strip_exif(img.crop(box))
+    sx, sy = img.size[0] / w, img.size[1] / h
+    box = (left * sx, upper * sy, right * sx, lower * sy)
+    return strip_exif(img.resize(size, PIL.Image.LANCZOS, box, reducing_gap=3))
+
+
+def _column_histograms(data, chunk_size=2 ** 17):
+    """Histogram of every column of `data`, with the channels concatenated
+    like `PIL.Image.histogram` does, shape (width, 256 * n_channels).
+
+    The pixels are binned `chunk_size` values (and bins) at a time, so
+    this takes little more memory than the histograms themselves."""
+    import numpy as np
+
+    if data.ndim == 2:
+        data = data[:, :, np.newaxis]
+    h, w, n_channels = data.shape
+    n_bins = 256 * n_channels
+    hist = np.zeros((w, n_bins), dtype=np.int64)
+    cols_per_chunk = max(chunk_size // n_bins, 1)
+    for j in range(0, w, cols_per_chunk):
+        cols = data[:, j : j + cols_per_chunk]
+        n_cols = cols.shape[1]
+        # Unique bin per (column, channel, value)
+        offsets = np.arange(n_cols)[:, np.newaxis] * n_bins
+        offsets = offsets + np.arange(n_channels) * 256
+        block = hist[j : j + n_cols].reshape(-1)
+        rows_per_chunk = max(chunk_size // offsets.size, 1)
+        for i in range(0, h, rows_per_chunk):
+            chunk = cols[i : i + rows_per_chunk]
+            block += np.bincount((chunk + offsets).ravel(), minlength=block.size)
+    return hist
+
+
+def _entropy(counts):
+    """Entropy of every row of histograms `counts`."""
+    import numpy as np
+
+    total = counts[0].sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c_log_c = np.where(counts > 0, counts * np.log2(counts), 0)
+    # -sum(p log p) with p = c / total
+    return np.log2(total) - c_log_c.sum(axis=1) / total
+
+
+def sliding_entropy(data, window):
+    """Entropy of every `window` wide vertical slice of `data`.
+
+    The histograms of all the columns are computed once, after which the
+    histogram of every window follows from a cumulative sum, so the cost
+    is linear in the image size."""
+    return _sliding_entropy(_column_histograms(data), window)
+
+
+def _sliding_entropy(hist, window, chunk_size=256):
+    """Entropy of every `window` consecutive rows of `hist` summed.
+
+    `hist` is overwritten by its cumulative sum, and the entropy is
+    computed `chunk_size` windows at a time, so this takes little more
+    memory than `hist` itself."""
+    import numpy as np
+
+    np.cumsum(hist, axis=0, out=hist)
+    n = len(hist) - window + 1
+    entropy = np.empty(n)
+    for i in range(0, n, chunk_size):
+        j = min(i + chunk_size, n)
+        counts = hist[i + window - 1 : j + window - 1].copy()
+        counts[int(i == 0) :] -= hist[max(i - 1, 0) : j - 1]
+        entropy[i:j] = _entropy(counts)
+    return entropy
+
+
+def _gray(data, rows_per_chunk=256):
+    """`data` as a float32 grey image."""
+    import numpy as np
+
+    if data.ndim == 2:
+        return data.astype(np.float32)
+    gray = np.empty(data.shape[:2], dtype=np.float32)
+    for i in range(0, data.shape[0], rows_per_chunk):
+        gray[i : i + rows_per_chunk] = data[i : i + rows_per_chunk].mean(axis=2)
+    return gray
+
+
+def _window_sums(values, window):
+    """Sum of every `window` long slice of `values`."""
+    import numpy as np
+
+    cumsum = np.concatenate([[0], np.cumsum(values, dtype=np.float64)])
+    return cumsum[window:] - cumsum[:-window]
+
+
+def _box_blur(a, k):
+    """Mean of every `k` x `k` square around the elements of `a`, from
+    an integral image."""
+    import numpy as np
+
+    pad = k // 2
+    padded = np.pad(a, pad, mode="edge")
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1))
+    integral[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+    h, w = a.shape
+    return (
+        integral[k : k + h, k : k + w]
+        - integral[:h, k : k + w]
+        - integral[k : k + h, :w]
+        + integral[:h, :w]
+    ) / k ** 2
+
+
+def column_edges(data):
+    """The edge energy, the summed absolute gradient, of every column."""
+    import numpy as np
+
+    gray = _gray(data)
+    energy = np.abs(np.diff(gray, axis=0)).sum(axis=0)
+    energy[1:] += np.abs(np.diff(gray, axis=1)).sum(axis=0)
+    return energy
+
+
+def column_saliency(data, size=64):
+    """The spectral residual saliency (Hou and Zhang, 2007) of every column.
+
+    The saliency map is computed on a `size` pixel version of `data`,
+    and spread evenly over the columns that each of its pixels covers."""
+    import numpy as np
+
+    gray = _gray(data)
+    h, w = gray.shape
+    f = max(min(h, w) // size, 1)
+    small = gray[: h // f * f, : w // f * f]
+    small = small.reshape(h // f, f, w // f, f).mean(axis=(1, 3))
+    spectrum = np.fft.fft2(small)
+    log_amplitude = np.log(np.abs(spectrum) + 1e-9)
+    residual = log_amplitude - _box_blur(log_amplitude, 3)
+    saliency = np.abs(np.fft.ifft2(np.exp(residual + 1j * np.angle(spectrum)))) ** 2
+    saliency = _box_blur(saliency, 3).sum(axis=0)
+    columns = np.zeros(w)
+    columns[: w // f * f] = np.repeat(saliency / f, f)
+    return columns
+
+
+def _thirds_sums(values, window):
+    """Sum of every `window` long slice of `values`, weighted by two tent
+    functions that peak at a third and two thirds of the slice.
+
+    The weight is linear in pieces, so with cumulative sums of `values`
+    and of `i * values[i]` every slice costs O(1)."""
+    import numpy as np
+
+    index = np.arange(len(values))
+    s0 = np.concatenate([[0], np.cumsum(values, dtype=np.float64)])
+    s1 = np.concatenate([[0], np.cumsum(index * values, dtype=np.float64)])
+    x = np.arange(len(values) - window + 1)
+    scores = np.zeros(len(x))
+    # (start, end, a, b): the weight is a + b * t for t between start and end
+    pieces = [(1, 2, -1, 6), (2, 3, 3, -6), (3, 4, -3, 6), (4, 5, 5, -6)]
+    for start, end, a, b in pieces:
+        lo, hi = x + round(window * start / 6), x + round(window * end / 6)
+        # a + b * (i - x) / window, summed over values[lo:hi]
+        scores += (a - b * x / window) * (s0[hi] - s0[lo])
+        scores += b / window * (s1[hi] - s1[lo])
+    return scores
+
+
+def sliding_edges(data, window):
+    """Edge energy of every `window` wide vertical slice of `data`."""
+    return _window_sums(column_edges(data), window)
+
+
+def sliding_saliency(data, window):
+    """Saliency of every `window` wide vertical slice of `data`."""
+    return _window_sums(column_saliency(data), window)
+
+
+def sliding_thirds(data, window):
+    """Saliency of every `window` wide vertical slice of `data`, counting
+    what lies on the lines at a third and two thirds of it the most."""
+    return _thirds_sums(column_saliency(data), window)
+
+
+# Scores of every crop along an image, see `sliding_entropy`
+CROP_SCORES = {
+    "entropy": sliding_entropy,
+    "edges": sliding_edges,
+    "saliency": sliding_saliency,
+    "thirds": sliding_thirds,
+}
+
+
+def _crop_geometry(size, min_ratio, max_ratio):
+    """The axis along which to crop an image of `size` (0 for x, 1 for
+    y) and the length of the crop along it."""
+    w, h = size
+    if w / h > max_ratio:  # Too wide
+        return 0, int(max_ratio * h)
     else:  # Too narrow
-        h_max = int(w / min_ratio)
+        return 1, int(w / min_ratio)
 
-        def _crop(y):
-            return crop(x=0, y=y, data=data, w=w, h=h_max)
 
-        xy_max = h - h_max
+def _box(size, axis, offset, window, align):
+    """The crop box, with `offset` rounded down to a multiple of `align`."""
+    offset -= offset % align[axis]
+    if axis == 0:
+        return (offset, 0, offset + window, size[1])
+    return (0, offset, size[0], offset + window)
 
-    to_minimize = lambda xy: -_entropy(_crop(xy))  # noqa: E731
-    x = minimize_scalar(to_minimize, bounds=(0, xy_max), method="bounded").x
-    return PIL.Image.fromarray(_crop(x))
+
+def crop_box_maximize_entropy(
+    img, min_ratio=4 / 5, max_ratio=90 / 47, align=(1, 1), score="entropy"
+):
+    """Find the crop with a compatible aspect ratio and maximal entropy,
+    or maximal another of the `CROP_SCORES`.
+
+    The offset of the crop is rounded down to a multiple of `align`,
+    which allows a lossless crop of a JPEG when `align` is its MCU size."""
+    import numpy as np
+
+    axis, window = _crop_geometry(img.size, min_ratio, max_ratio)
+    data = np.array(img)
+    if axis == 1:
+        data = data.swapaxes(0, 1)
+    offset = int(np.argmax(CROP_SCORES[score](data, window)))
+    return _box(img.size, axis, offset, window, align)
+
+
+def _strips(img, axis, start, stop, max_bytes=2 ** 22):
+    """Crops of `img` from `start` to `stop` along `axis`, of at most
+    `max_bytes` (but at least one row or column) each, so only one of
+    them is in memory at a time."""
+    if stop <= start:
+        return
+    w, h = img.size
+    size = max(max_bytes // ((stop - start) * len(img.getbands())), 1)
+    if axis == 0:
+        for y in range(0, h, size):
+            yield img.crop((start, y, stop, min(y + size, h)))
+    else:
+        for x in range(0, w, size):
+            yield img.crop((x, start, min(x + size, w), stop))
+
+
+def _column_histograms_of(img, axis, start, stop):
+    """`_column_histograms` of `img` from `start` to `stop` along `axis`."""
+    import numpy as np
+
+    hist = 0
+    for strip in _strips(img, axis, start, stop):
+        data = np.asarray(strip)
+        hist += _column_histograms(data if axis == 0 else data.swapaxes(0, 1))
+    return hist
+
+
+def _refine_offset(img, axis, window, lo, hi):
+    """The offset in `range(lo, hi + 1)` of the `window` long slice of
+    `img` along `axis` that has maximal entropy.
+
+    All these slices share the pixels from `hi` to `lo + window`, of
+    which a single histogram is made. Only the pixels in which they
+    differ get a histogram per column (or row)."""
+    import numpy as np
+
+    if lo == hi:
+        return lo
+    if hi >= lo + window:  # Nothing in common
+        hist = _column_histograms_of(img, axis, lo, hi + window)
+        return lo + int(np.argmax(_sliding_entropy(hist, window)))
+    common = sum(
+        np.array(strip.histogram(), dtype=np.int64)
+        for strip in _strips(img, axis, hi, lo + window)
+    )
+    left = _column_histograms_of(img, axis, lo, hi)
+    right = _column_histograms_of(img, axis, lo + window, hi + window)
+    n = hi - lo
+    # The slice at lo + k has the columns left[k:], common and right[:k]
+    counts = np.zeros((n + 1, len(common)), dtype=np.int64)
+    counts[:n] = np.cumsum(left[::-1], axis=0)[::-1]
+    counts[1:] += np.cumsum(right, axis=0)
+    counts += common
+    return lo + int(np.argmax(_entropy(counts)))
+
+
+def crop_box_multiscale(
+    photo,
+    min_ratio=4 / 5,
+    max_ratio=90 / 47,
+    size=ANALYSIS_SIZE,
+    margin=2,
+    score="entropy",
+    max_bytes=MEMORY_LIMIT,
+):
+    """Like `crop_box_maximize_entropy`, but fast for large photos.
+
+    The crop is searched for on a thumbnail of at least `size` pixels,
+    which a JPEG decodes directly at 1/2, 1/4 or 1/8 scale. For the
+    entropy, only the offsets within `margin` thumbnail pixels of the
+    best one are then tried on the full image, without a histogram of
+    every column of it. The other scores change smoothly with the
+    offset, so their crop is taken from the thumbnail. The crop of a
+    JPEG is aligned to its MCU, so `jpegtran` can make it.
+
+    When the full image takes more than `max_bytes`, a JPEG is refined
+    at the largest of its scales that fits, see `limit_decoding`."""
+    import numpy as np
+
+    with open(photo, "rb") as f:
+        img = open_image(f)
+        full_size = img.size
+        is_jpeg = img.format == "JPEG"
+        align = _mcu_size(img) if is_jpeg else (1, 1)
+        limit_decoding(img, (size, size), max_bytes)
+        if is_jpeg:
+            thumb = img
+        else:
+            img.load()
+            thumb = img.reduce(max(min(full_size) // size, 1))
+        data = np.asarray(thumb)
+    axis, window = _crop_geometry(full_size, min_ratio, max_ratio)
+    scale = thumb.size[axis] / full_size[axis]
+    if axis == 1:
+        data = data.swapaxes(0, 1)
+    scores = CROP_SCORES[score](data, max(round(window * scale), 1))
+    offset = min(round(int(np.argmax(scores)) / scale), full_size[axis] - window)
+    if score != "entropy":
+        return _box(full_size, axis, offset, window, align)
+    if is_jpeg:  # Decode it again, at full size if that fits
+        with open(photo, "rb") as f:
+            img = open_image(f)
+            limit_decoding(img, full_size, max_bytes)
+            img.load()
+    # The offsets on the decoded image, which may be smaller
+    scale = img.size[axis] / full_size[axis]
+    length = img.size[axis]
+    scaled_window = min(round(window * scale), length)
+    offset = min(round(offset * scale), length - scaled_window)
+    pad = math.ceil(margin * length / thumb.size[axis])
+    lo = max(offset - pad, 0)
+    hi = min(offset + pad, length - scaled_window)
+    offset = _refine_offset(img, axis, scaled_window, lo, hi)
+    offset = min(round(offset / scale), full_size[axis] - window)
+    return _box(full_size, axis, offset, window, align)
+
+
+def crop_maximize_entropy(img, min_ratio=4 / 5, max_ratio=90 / 47):
+    return img.crop(crop_box_maximize_entropy(img, min_ratio, max_ratio))
+
+
+def _mcu_size(img):
+    """Size of the minimum coded unit of a JPEG."""
+    h_sampling = max(h for _, h, _, _ in img.layer)
+    v_sampling = max(v for _, _, v, _ in img.layer)
+    return 8 * h_sampling, 8 * v_sampling
+
+
+def jpegtran_crop(photo, fname, box):
+    """Losslessly crop a JPEG in the DCT domain and drop all its metadata.
+
+    Returns False when `jpegtran` is not installed."""
+    import shutil
+    import subprocess
+
+    if shutil.which("jpegtran") is None:
+        return False
+    x, y, right, lower = box
+    geometry = f"{right - x}x{lower - y}+{x}+{y}"
+    cmd = ["jpegtran", "-copy", "none", "-crop", geometry, "-outfile", fname, photo]
+    return subprocess.run(cmd).returncode == 0
+
+
+# APP1, APP3 to APP13, APP15 and COM
+METADATA_MARKERS = {0xE1, *range(0xE3, 0xEE), 0xEF, 0xFE}
+
+
+def strip_exif_from_jpeg(data):
+    """Remove the metadata from the bytes of a JPEG without decoding it.
+
+    Drops the comments and every APPn segment (EXIF, XMP, IPTC, ...)
+    except for the ones that change how the pixels are decoded: APP0
+    (JFIF), APP2 (ICC profile) and APP14 (Adobe color transform)."""
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("Not a JPEG.")
+    segments = [data[:2]]
+    i = 2
+    while i < len(data) - 1:
+        if data[i] != 0xFF:
+            raise ValueError(f"Expected a JPEG marker at byte {i}.")
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # No length field
+            segments.append(data[i : i + 2])
+            i += 2
+            continue
+        if marker == 0xDA:  # Start of scan, the rest is image data
+            segments.append(data[i:])
+            break
+        length = int.from_bytes(data[i + 2 : i + 4], "big")
+        if marker not in METADATA_MARKERS:
+            segments.append(data[i : i + 2 + length])
+        i += 2 + length
+    return b"".join(segments)
 
 
 def strip_exif(img):
-    """Strip EXIF data from the photo to avoid a 500 error."""
-    data = list(img.getdata())
+    """Strip EXIF data from the photo to avoid a 500 error.
+
+    The pixels are copied buffer-to-buffer by PIL, so they are never
+    turned into Python objects."""
+    import PIL.Image
+
     image_without_exif = PIL.Image.new(img.mode, img.size)
-    image_without_exif.putdata(data)
+    image_without_exif.paste(img)
     return image_without_exif
 
 
-def append_to_uploaded_file(uploaded_file, photo):
-    with open(uploaded_file, "a") as f:
-        f.write(photo + "\n")
+def _timed(timings, stage, f, *args, **kwargs):
+    """Call `f` and store how long it took in `timings[stage]`."""
+    t_start = time.time()
+    try:
+        return f(*args, **kwargs)
+    finally:
+        timings[stage] = time.time() - t_start
+
+
+def print_timings(timings, total):
+    """Print the time every stage took and the total time."""
+    width = max(map(len, timings), default=5)
+    for stage, seconds in timings.items():
+        print(f"{stage:<{width}} {seconds:6.2f} s")
+    print(f"{'total':<{width}} {total:6.2f} s", end="")
+    print(f" (the stages add up to {sum(timings.values()):.2f} s)")
+
+
+def post(
+    upload_log, catalog, fname=None, caption_only=False, bot=None, crop_score="entropy"
+):
+    """Post `fname`, or a random photo out of the least uploaded ones.
+
+    Continues the stored `session.Session`, unless a logged-in `bot` is
+    passed. Unless `batch.py` already did, the photo is cropped with
+    the `crop_score`, one of the `CROP_SCORES`. Returns whether the
+    upload succeeded.
+
+    The login, the quote, the caption (geocoding) and the preparation of
+    the image run at the same time, so a post takes about as long as
+    the slowest of those plus the upload."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    t_start = time.time()
+    timings = {}
+    with ThreadPoolExecutor(4) as pool:
+        login = None
+        if bot is None and not caption_only:
+            config = read_config()
+            login = pool.submit(
+                _timed, timings, "login", lambda: session.Session(**config).bot
+            )
+        quote = pool.submit(_timed, timings, "quote", get_random_quote, PEOPLE)
+        photo = fname
+        if photo is None:
+            photo = _timed(timings, "choose", catalog.random_least_uploaded)
+
+        # Use the caption and crop from `batch.py` if they are there
+        precomputed = catalog.get_metadata(os.path.basename(photo)) or {}
+        if not caption_only:
+            box = precomputed.get("crop_box")
+            pic = pool.submit(
+                _timed,
+                timings,
+                "prepare",
+                prepare_and_fix_photo,
+                photo,
+                box,
+                crop_score,
+            )
+        location = precomputed.get("caption")
+        if location is None:
+            location = _timed(timings, "caption", get_caption, photo)
+        caption = quote.result() + location
+        print(caption)
+
+        if caption_only:
+            return False
+
+        pic = pic.result()
+        try:
+            if login is not None:
+                bot = login.result()
+            print(f"Uploading `{photo}`")
+            print(os.path.basename(photo))
+            upload = _timed(timings, "upload", bot.upload_photo, pic, caption=caption)
+        finally:
+            # instabot renames the photo that it uploaded
+            for fname in (pic, f"{pic}.REMOVE_ME"):
+                if os.path.exists(fname):
+                    os.remove(fname)
+
+    # After succeeding add the fname to the upload log
+    photo_base = os.path.basename(photo)
+    if upload:
+        time.sleep(4)  # XXX: why this?
+        print(colored(f"Upload of {photo_base} succeeded.", "green"))
+        upload_log.append(photo_base)
+    else:
+        print(colored(f"Upload of {photo_base} failed.", "red"))
+    print_timings(timings, time.time() - t_start)
+    return bool(upload)
 
 
 def main():
@@ -351,39 +1085,25 @@ def main():
     parser.add_argument(
         "--caption_only", action="store_true", help="only return the caption."
     )
-    args = parser.parse_args()
-    caption = get_random_quote(
-        ["Hunter S. Thompson", "Albert Einstein", "Charles Bukowski"]
+    parser.add_argument(
+        "--fill_quotes", action="store_true", help="only fill the quote pools."
     )
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    uploaded_file = os.path.join(dir_path, "uploaded.txt")
+    parser.add_argument(
+        "--crop",
+        choices=list(CROP_SCORES),
+        default="entropy",
+        help="what the crop should keep the most of.",
+    )
+    args = parser.parse_args()
+    if args.fill_quotes:
+        for person in PEOPLE + [quotes.GENERIC]:
+            quote_pool().refill(person)
+        return
 
-    if args.fname is None:
-        photo_folder = os.path.join(dir_path, "photos")
-        photo = choose_random_photo(uploaded_file, photo_folder)
-    else:
-        photo = args.fname
-
-    pic = prepare_and_fix_photo(photo)
-    caption += get_caption(photo)
-    print(caption)
-
-    if not args.caption_only:
-        print(f"Uploading `{photo}`")
-        print(os.path.basename(photo))
-        bot = instabot.Bot()
-        bot.login(**read_config())
-        upload = bot.upload_photo(pic, caption=caption)
-
-        # After succeeding append the fname to the uploaded.txt file
-        photo_base = os.path.basename(photo)
-        if upload:
-            time.sleep(4)  # XXX: why this?
-            print(colored(f"Upload of {photo_base} succeeded.", "green"))
-            append_to_uploaded_file(uploaded_file, photo_base)
-        else:
-            print(colored(f"Upload of {photo_base} failed.", "red"))
-        bot.logout()
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    upload_log = get_upload_log(dir_path)
+    catalog = get_catalog(upload_log, os.path.join(dir_path, "photos"))
+    post(upload_log, catalog, args.fname, args.caption_only, crop_score=args.crop)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+"""A pool of quotes that is filled ahead of time and stored on disk.
+
+Taking a quote from the pool never touches the network. When a pool
+runs low, it is refilled in a background thread, so the next post has
+fresh quotes again.
+"""
+
+import json
+import os
+import threading
+
+GENERIC = ""  # Key of the quotes that are not from a specific person
+
+
+class QuotePool:
+    """Quotes per person, plus generic ones under the key `GENERIC`.
+
+    `fetch(key)` returns a single new quote from the network. The last
+    `n_recent` quotes that were used are remembered, and are never put
+    in the pool again.
+    """
+
+    def __init__(self, fname, fetch, low_watermark=10, size=30, n_recent=500):
+        self.fname = os.path.expanduser(fname)
+        self.fetch = fetch
+        self.low_watermark = low_watermark
+        self.size = size
+        self.n_recent = n_recent
+        self.lock = threading.Lock()
+        self.refills = {}  # key -> running refill thread
+        try:
+            with open(self.fname, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {"pool": {}, "recent": []}
+        self.pool = data["pool"]
+        self.recent = data["recent"]
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.fname), exist_ok=True)
+        tmp = self.fname + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"pool": self.pool, "recent": self.recent}, f)
+        os.replace(tmp, self.fname)
+
+    def pop(self, key=GENERIC):
+        """Take a quote from the pool of `key`, or None if it is empty.
+
+        Starts a refill in the background when the pool is running low."""
+        with self.lock:
+            quotes = self.pool.get(key, [])
+            quote = quotes.pop(0) if quotes else None
+            if quote is not None:
+                self.recent = (self.recent + [quote])[-self.n_recent :]
+                self._save()
+            low = len(quotes) < self.low_watermark
+        if low:
+            self.refill_in_background(key)
+        return quote
+
+    def refill(self, key=GENERIC):
+        """Fetch quotes until the pool of `key` holds `size` quotes.
+
+        Gives up after `3 * size` attempts, because a person might not
+        have that many quotes."""
+        for _ in range(3 * self.size):
+            with self.lock:
+                quotes = self.pool.setdefault(key, [])
+                if len(quotes) >= self.size:
+                    return
+            try:
+                quote = self.fetch(key)
+            except Exception as e:
+                print(f"Fetching a quote failed: {e!r}")
+                continue
+            with self.lock:
+                if quote and quote not in quotes and quote not in self.recent:
+                    quotes.append(quote)
+                    self._save()
+
+    def refill_in_background(self, key=GENERIC):
+        """Start refilling the pool of `key`, unless that already happens.
+
+        The thread is not a daemon, so a script waits for it before it
+        exits (after it is done posting)."""
+        with self.lock:
+            thread = self.refills.get(key)
+            if thread is not None and thread.is_alive():
+                return thread
+            thread = threading.Thread(target=self.refill, args=(key,))
+            self.refills[key] = thread
+        thread.start()
+        return thread
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Post photos from a long-running process instead of from cron.
+
+Run `python scheduler.py` (e.g. in `screen` or as a systemd service) and
+it posts `--per_day` photos a day in the posting windows, at a random
+moment within `--jitter` seconds after a slot opens. It keeps one
+`session.Session` logged in and the catalog, caches and upload log in
+memory between posts.
+
+With `--accounts accounts.json` it posts for several accounts from one
+process, each in its own thread with its own login, upload log and
+posting windows, see `run_accounts`.
+"""
+
+import datetime
+import os.path
+import random
+import time
+
+
+def parse_windows(windows):
+    """Parse "8-10,14-16" into [(8, 10), (14, 16)]."""
+    return [tuple(int(h) for h in w.split("-")) for w in windows.split(",")]
+
+
+def at_hour(day, hour):
+    """The time at `hour` (up to 24) local time on `day`, also on the
+    days that daylight saving time starts or ends."""
+    midnight = datetime.datetime.combine(day, datetime.time())
+    return (midnight + datetime.timedelta(hours=hour)).timestamp()
+
+
+class Scheduler:
+    """Call `post()` at most `per_day` times a day within `windows`.
+
+    `windows` are (start_hour, end_hour) pairs in local time, posts are
+    at least `min_interval` seconds apart and a failed post is retried
+    after `retry_after` seconds. `clock`, `sleep` and `rng` can be
+    replaced to test the scheduling without waiting.
+
+    After every post, `last_latency` holds how long it took, and
+    `next_run` always holds the time of the next post.
+    """
+
+    def __init__(
+        self,
+        post,
+        windows=((8, 10), (14, 16), (17, 19)),
+        per_day=1,
+        jitter=1800,
+        min_interval=3600,
+        retry_after=900,
+        last_post=None,
+        clock=time.time,
+        sleep=time.sleep,
+        rng=random,
+    ):
+        self.post = post
+        self.windows = sorted(windows)
+        self.per_day = per_day
+        self.jitter = jitter
+        self.min_interval = min_interval
+        self.retry_after = retry_after
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng
+        self.posts = [] if last_post is None else [last_post]
+        self.last_failure = None
+        self.last_latency = None
+        self.next_run = self._schedule()
+
+    def _posts_on(self, day):
+        return sum(datetime.datetime.fromtimestamp(t).date() == day for t in self.posts)
+
+    def _schedule(self):
+        """The time of the next post."""
+        earliest = self.clock()
+        if self.posts:
+            earliest = max(earliest, self.posts[-1] + self.min_interval)
+        if self.last_failure is not None:
+            earliest = max(earliest, self.last_failure + self.retry_after)
+        day = datetime.datetime.fromtimestamp(earliest).date()
+        if self._posts_on(day) >= self.per_day:
+            day += datetime.timedelta(days=1)
+        while True:
+            for start, end in self.windows:
+                start, end = at_hour(day, start), at_hour(day, end)
+                if end > earliest:
+                    start = max(start, earliest)
+                    return start + self.rng.uniform(0, min(self.jitter, end - start))
+            day += datetime.timedelta(days=1)
+
+    def step(self):
+        """Wait for the next post and make it."""
+        wait = self.next_run - self.clock()
+        if wait > 0:
+            print(f"Next post at {time.ctime(self.next_run)}.")
+            self.sleep(wait)
+        t_start = self.clock()
+        try:
+            success = self.post()
+        except Exception as e:
+            print(f"Posting failed: {e!r}")
+            success = False
+        self.last_latency = self.clock() - t_start
+        print(f"Posting took {self.last_latency:.1f} seconds.")
+        if success:
+            self.posts = (self.posts + [t_start])[-self.per_day :]
+            self.last_failure = None
+        else:
+            self.last_failure = t_start
+        self.next_run = self._schedule()
+        return success
+
+    def run(self):
+        while True:
+            self.step()
+
+
+def run_account(account, credentials, shared_metadata=None):
+    """Post for `account` forever, see `run_accounts`."""
+    import instacron
+    import session
+
+    upload_log = instacron.get_upload_log(os.path.expanduser(account["folder"]))
+    photos = os.path.expanduser(account["photos"])
+    catalog = instacron.get_catalog(upload_log, photos, shared_metadata)
+    login = session.Session(**credentials)
+
+    def post():
+        catalog.update()
+        return instacron.post(upload_log, catalog, bot=login.bot)
+
+    scheduler = Scheduler(
+        post,
+        parse_windows(account.get("windows", "8-10,14-16,17-19")),
+        account.get("per_day", 1),
+        account.get("jitter", 1800),
+        last_post=upload_log.last_upload(),
+    )
+    scheduler.run()
+
+
+def run_accounts(accounts):
+    """Post for every account in `accounts`, each in its own thread.
+
+    An account is a dict with the "config" file with its login (see
+    `instacron.read_config`), the "folder" with its upload log and
+    catalog and the "photos" folder it posts from. "windows", "per_day"
+    and "jitter" set its posting times, like the command line options.
+
+    The geocode, quote and photo metadata caches are shared by all
+    accounts. Accounts with the same "photos" folder use the captions
+    and crops that `batch.py` stored in the catalog of the first one.
+    """
+    import threading
+
+    import instacron
+
+    threads = []
+    catalogs = {}  # photo folder -> catalog with its metadata
+    for account in accounts:
+        # Ask for missing logins before the threads start printing
+        credentials = instacron.read_config(account["config"])
+        photos = os.path.realpath(os.path.expanduser(account["photos"]))
+        catalog = os.path.join(os.path.expanduser(account["folder"]), "catalog.sqlite")
+        first = catalogs.setdefault(photos, catalog)
+        shared_metadata = None if first == catalog else first
+        thread = threading.Thread(
+            target=run_account, args=(account, credentials, shared_metadata)
+        )
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    import instacron
+
+    parser = argparse.ArgumentParser(description="Instacron scheduler.")
+    parser.add_argument(
+        "--windows",
+        default="8-10,14-16,17-19",
+        help="hours of the day in which to post.",
+    )
+    parser.add_argument("--per_day", type=int, default=1, help="posts per day.")
+    parser.add_argument(
+        "--jitter", type=float, default=1800, help="maximal random delay in seconds."
+    )
+    parser.add_argument(
+        "--accounts", help="JSON file with a list of accounts to post for."
+    )
+    args = parser.parse_args()
+    if args.accounts is not None:
+        with open(args.accounts, encoding="utf-8") as f:
+            run_accounts(json.load(f))
+    else:
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        account = {
+            "folder": dir_path,
+            "photos": os.path.join(dir_path, "photos"),
+            "windows": args.windows,
+            "per_day": args.per_day,
+            "jitter": args.jitter,
+        }
+        run_account(account, instacron.read_config())
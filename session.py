@@ -0,0 +1,121 @@
+"""A logged-in Instagram session that is reused across runs.
+
+Logging in is the slowest request we make and the one Instagram is the
+most suspicious of. A `Session` therefore stores the cookies and device
+ids of a login in `~/.config/instacron/<username>_session.json`
+(readable only by the user) and the next run continues with those,
+which instabot checks with a couple of feed requests. Only when the
+cookies have expired it logs in with the password again.
+
+How often that happens, and how long it took, is kept in
+`<username>_logins.json` next to it.
+"""
+
+import json
+import os
+import time
+
+SESSION_DIR = "~/.config/instacron"
+
+
+def _read_json(fname, default=None):
+    try:
+        with open(fname, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+class Session:
+    """The login of `username` with `password`.
+
+    `bot` is the `instabot.Bot` to log in, a plain one by default. Use
+    `session.bot` to get it logged in. In a long running process call
+    `ensure()` before a batch of requests, it checks the session with a
+    single request at most every `check_every` seconds and logs in
+    again when Instagram no longer accepts it.
+    """
+
+    def __init__(
+        self, username, password, bot=None, directory=SESSION_DIR, check_every=600
+    ):
+        self.username = username
+        self.password = password
+        self.directory = os.path.expanduser(directory)
+        self.cookie_fname = os.path.join(self.directory, f"{username}_session.json")
+        self.stats_fname = os.path.join(self.directory, f"{username}_logins.json")
+        self.check_every = check_every
+        self._bot = bot
+        self.logged_in = False
+        self.last_check = None
+
+    @property
+    def stats(self):
+        """Number of password logins, resumed sessions and the time
+        they took in total."""
+        default = {"logins": 0, "resumes": 0, "seconds": 0.0, "last_login": None}
+        return _read_json(self.stats_fname, default)
+
+    def _record(self, resumed, seconds):
+        stats = self.stats
+        stats["resumes" if resumed else "logins"] += 1
+        stats["seconds"] += seconds
+        if not resumed:
+            stats["last_login"] = time.time()
+        tmp = self.stats_fname + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stats, f)
+        os.replace(tmp, self.stats_fname)
+
+    def _session_id(self):
+        data = _read_json(self.cookie_fname, {})
+        return data.get("cookie", {}).get("sessionid")
+
+    def login(self):
+        """Continue the stored session, or log in with the password if
+        there is none or it expired. Returns success."""
+        if self._bot is None:
+            import instabot
+
+            self._bot = instabot.Bot()
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        session_id = self._session_id()
+        t_start = time.time()
+        # instabot logs in with the password (`force`, even if it thinks it
+        # still is logged in) when the stored cookies are not accepted, but
+        # keeps the device ids that are stored with them
+        self.logged_in = self._bot.login(
+            username=self.username,
+            password=self.password,
+            force=True,
+            use_cookie=True,
+            cookie_fname=self.cookie_fname,
+            is_threaded=True,  # Logging in is not always in the main thread
+        )
+        if not self.logged_in:
+            return False
+        if os.path.exists(self.cookie_fname):
+            os.chmod(self.cookie_fname, 0o600)
+        resumed = session_id is not None and session_id == self._session_id()
+        self._record(resumed, time.time() - t_start)
+        self.last_check = time.time()
+        return True
+
+    def ensure(self):
+        """Make sure that the session is (still) logged in."""
+        if not self.logged_in:
+            return self.login()
+        if time.time() - self.last_check < self.check_every:
+            return True
+        api = self._bot.api
+        if api.get_username_info(api.user_id):
+            self.last_check = time.time()
+            return True
+        return self.login()
+
+    @property
+    def bot(self):
+        """The logged-in bot."""
+        if not self.ensure():
+            raise RuntimeError(f"Could not log in as {self.username}.")
+        return self._bot
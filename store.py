@@ -0,0 +1,355 @@
+"""Lists of user ids for `follow_bot.py`, stored in SQLite.
+
+They replace the `config/*.txt` files of `instabot.utils.file`, which are
+read, split and (on every removal) rewritten in full for every access.
+Here every list is a set of items that each have a time (when they were
+added) and a unique position `pos` in `range(size)`. Membership,
+adding and removing an item and picking a random item are index
+lookups, and the items can be read in the order of their time.
+
+The database is in WAL mode and every change is a transaction. A list
+that does not exist yet is filled from its text file, if there is one.
+
+The same database keeps `Snapshots` of the followers and following of
+the account, to see who came and went between two downloads.
+"""
+
+import os
+import random
+import sqlite3
+import time
+import zlib
+from array import array
+from functools import lru_cache
+from itertools import accumulate
+
+STATE = "config/state.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lists (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    list TEXT NOT NULL,
+    item TEXT NOT NULL,
+    t REAL NOT NULL,
+    pos INTEGER NOT NULL,
+    PRIMARY KEY (list, item)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS items_pos ON items (list, pos);
+CREATE INDEX IF NOT EXISTS items_time ON items (list, t);
+CREATE TABLE IF NOT EXISTS snapshots (
+    name TEXT NOT NULL,
+    t REAL NOT NULL,
+    user_ids BLOB NOT NULL,
+    PRIMARY KEY (name, t)
+);
+CREATE TABLE IF NOT EXISTS snapshot_changes (
+    name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    added INTEGER NOT NULL,
+    PRIMARY KEY (name, user_id)
+);
+"""
+
+
+class Store:
+    """The SQLite database with all the lists."""
+
+    def __init__(self, fname=STATE):
+        if os.path.dirname(fname):
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+        # Also used by the vetting threads of `follow_bot.MyBot`, under its lock
+        self.db = sqlite3.connect(fname, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def list(self, fname, timed=False):
+        """The `StoredList` for the text file `fname`, which is imported
+        the first time. With `timed`, its lines are "item,time"."""
+        name = os.path.splitext(os.path.basename(fname))[0]
+        # Created and imported at once, so a failed import is tried again
+        with self.db:
+            created = self.db.execute(
+                "INSERT OR IGNORE INTO lists (name, size) VALUES (?, 0)", (name,)
+            ).rowcount
+            stored_list = StoredList(self, name)
+            if created and os.path.exists(fname):
+                migrate(fname, stored_list, timed)
+        return stored_list
+
+    def close(self):
+        self.db.close()
+
+
+@lru_cache()
+def open_store(fname=STATE):
+    return Store(fname)
+
+
+class StoredList:
+    """A list in a `Store`, with (most of) the interface of
+    `instabot.utils.file` but without duplicates."""
+
+    def __init__(self, store, name):
+        self.db = store.db
+        self.name = name
+        exists = self.db.execute("SELECT 1 FROM lists WHERE name = ?", (name,))
+        if exists.fetchone() is None:
+            with self.db:
+                self.db.execute(
+                    "INSERT OR IGNORE INTO lists (name, size) VALUES (?, 0)", (name,)
+                )
+
+    def __len__(self):
+        row = self.db.execute("SELECT size FROM lists WHERE name = ?", (self.name,))
+        return row.fetchone()[0]
+
+    def __contains__(self, item):
+        row = self.db.execute(
+            "SELECT 1 FROM items WHERE list = ? AND item = ?", (self.name, str(item))
+        )
+        return row.fetchone() is not None
+
+    def __iter__(self):
+        return iter(self.list)
+
+    @property
+    def list(self):
+        """All items, from old to new."""
+        return [item for item, _ in self.by_time()]
+
+    @property
+    def set(self):
+        rows = self.db.execute("SELECT item FROM items WHERE list = ?", (self.name,))
+        return {item for item, in rows}
+
+    def by_time(self, limit=None, reverse=False):
+        """The `limit` oldest (or newest) (item, time) pairs."""
+        order = "DESC" if reverse else "ASC"
+        return self.db.execute(
+            "SELECT item, t FROM items WHERE list = ?"
+            f" ORDER BY t {order}, rowid {order} LIMIT ?",
+            (self.name, -1 if limit is None else limit),
+        ).fetchall()
+
+    def older_than(self, t, limit=None):
+        """The `limit` oldest (item, time) pairs that were added before `t`."""
+        return self.db.execute(
+            "SELECT item, t FROM items WHERE list = ? AND t < ?"
+            " ORDER BY t, rowid LIMIT ?",
+            (self.name, t, -1 if limit is None else limit),
+        ).fetchall()
+
+    def time(self, item):
+        """When `item` was added, or None if it is not in the list."""
+        row = self.db.execute(
+            "SELECT t FROM items WHERE list = ? AND item = ?", (self.name, str(item))
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _insert(self, timed_items):
+        """Add the (item, time) pairs whose item is not in the list yet,
+        in the current transaction."""
+        size = len(self)
+        for item, t in timed_items:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO items (list, item, t, pos) VALUES (?, ?, ?, ?)",
+                (self.name, str(item), t, size),
+            )
+            size += cursor.rowcount
+        self.db.execute("UPDATE lists SET size = ? WHERE name = ?", (size, self.name))
+
+    def _add(self, timed_items):
+        """Add the (item, time) pairs whose item is not in the list yet."""
+        with self.db:
+            self._insert(timed_items)
+
+    def extend(self, items, t=None):
+        """Add the `items` that are not in the list yet, at time `t`
+        (default now)."""
+        t = time.time() if t is None else t
+        self._add((item, t) for item in items)
+
+    def append(self, item, t=None):
+        self.extend([item], t)
+
+    def remove(self, item):
+        """Remove `item` by moving the last item into its position."""
+        with self.db:
+            row = self.db.execute(
+                "SELECT pos FROM items WHERE list = ? AND item = ?",
+                (self.name, str(item)),
+            ).fetchone()
+            if row is None:
+                return
+            last = len(self) - 1
+            self.db.execute(
+                "DELETE FROM items WHERE list = ? AND item = ?", (self.name, str(item))
+            )
+            self.db.execute(
+                "UPDATE items SET pos = ? WHERE list = ? AND pos = ?",
+                (row[0], self.name, last),
+            )
+            self.db.execute(
+                "UPDATE lists SET size = ? WHERE name = ?", (last, self.name)
+            )
+
+    def random(self):
+        size = len(self)
+        if not size:
+            raise IndexError(f"The list {self.name} is empty.")
+        row = self.db.execute(
+            "SELECT item FROM items WHERE list = ? AND pos = ?",
+            (self.name, random.randrange(size)),
+        )
+        return row.fetchone()[0]
+
+
+def encode_user_ids(user_ids):
+    """The (numeric) `user_ids` as the compressed differences of the
+    sorted ids, 3 to 4 bytes per id."""
+    user_ids = sorted(int(u) for u in user_ids)
+    deltas = array("Q", (b - a for a, b in zip([0] + user_ids, user_ids)))
+    return zlib.compress(deltas.tobytes())
+
+
+def decode_user_ids(data):
+    deltas = array("Q")
+    deltas.frombytes(zlib.decompress(data))
+    return {str(u) for u in accumulate(deltas)}
+
+
+class Snapshots:
+    """The user ids that `fetch()` downloads (the followers or following
+    of the account), downloaded again when they are older than `ttl`
+    seconds.
+
+    `set` is the newest snapshot, in which `add` and `discard` record our
+    own (un)follows until the next download. They are stored too, so
+    they are not lost on a restart. Every download is stored, the newest
+    `keep` are kept to `diff` against.
+    """
+
+    def __init__(self, store, name, fetch, ttl=5 * 3600, keep=30):
+        self.db = store.db
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.keep = keep
+        self.t, self._set = None, None
+        row = self._snapshot(0)
+        if row is not None:
+            self.t, self._set = row[0], decode_user_ids(row[1])
+            changes = self.db.execute(
+                "SELECT user_id, added FROM snapshot_changes WHERE name = ?",
+                (name,),
+            )
+            for user_id, added in changes:
+                (self._set.add if added else self._set.discard)(user_id)
+
+    def _snapshot(self, i, before=None):
+        """The `i`th newest (time, user_ids) row, taken before `before`."""
+        return self.db.execute(
+            "SELECT t, user_ids FROM snapshots WHERE name = ? AND t <= ?"
+            " ORDER BY t DESC LIMIT 1 OFFSET ?",
+            (self.name, float("inf") if before is None else before, i),
+        ).fetchone()
+
+    @property
+    def set(self):
+        if self.t is None or time.time() - self.t > self.ttl:
+            self.refresh()
+        return self._set
+
+    def __len__(self):
+        return len(self.set)
+
+    def __contains__(self, user_id):
+        return str(user_id) in self.set
+
+    def __iter__(self):
+        return iter(self.set)
+
+    def refresh(self):
+        """Download and store a new snapshot."""
+        user_ids = {str(u) for u in self.fetch()}
+        t = time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO snapshots (name, t, user_ids) VALUES (?, ?, ?)",
+                (self.name, t, encode_user_ids(user_ids)),
+            )
+            self.db.execute(
+                "DELETE FROM snapshots WHERE name = ? AND t NOT IN"
+                " (SELECT t FROM snapshots WHERE name = ? ORDER BY t DESC LIMIT ?)",
+                (self.name, self.name, self.keep),
+            )
+            self.db.execute("DELETE FROM snapshot_changes WHERE name = ?", (self.name,))
+        self.t, self._set = t, user_ids
+
+    def _change(self, user_id, added):
+        """Record that we (un)followed `user_id` since the last download."""
+        if self._set is None:
+            return  # The first download will have it
+        user_id = str(user_id)
+        (self._set.add if added else self._set.discard)(user_id)
+        with self.db:
+            self.db.execute(
+                "REPLACE INTO snapshot_changes (name, user_id, added) VALUES (?, ?, ?)",
+                (self.name, user_id, int(added)),
+            )
+
+    def add(self, user_id):
+        self._change(user_id, True)
+
+    def discard(self, user_id):
+        self._change(user_id, False)
+
+    def diff(self, since=None):
+        """The user ids that were added and removed since the last
+        snapshot taken at or before `since`, by default the previous one."""
+        current = self.set
+        row = self._snapshot(1) if since is None else self._snapshot(0, since)
+        old = set() if row is None else decode_user_ids(row[1])
+        return current - old, old - current
+
+
+def migrate(fname, stored_list, timed=False):
+    """Add the lines of the text file `fname` to `stored_list`, in the
+    current transaction.
+
+    With `timed` the lines are "item,time", otherwise all items get the
+    modification time of the file, and keep their order. Raises a
+    ValueError on a line without a valid time."""
+    with open(fname) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if not timed:
+        t = os.path.getmtime(fname)
+        stored_list._insert((item, t) for item in lines)
+        return
+    timed_items = []
+    for line in lines:
+        item, sep, t = line.rpartition(",")
+        if not sep:
+            raise ValueError(f'Expected "item,time" in {fname}, got "{line}".')
+        timed_items.append((item, float(t)))
+    stored_list._insert(timed_items)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import text lists into the store.")
+    parser.add_argument("fnames", nargs="+", help="the text files to import")
+    parser.add_argument("--store", default=STATE, help="the SQLite database")
+    parser.add_argument(
+        "--timed", action="store_true", help='the lines are "item,time"'
+    )
+    args = parser.parse_args()
+    store = Store(args.store)
+    for fname in args.fnames:
+        stored_list = store.list(fname, args.timed)
+        print(f"{stored_list.name} holds {len(stored_list)} items.")
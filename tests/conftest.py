@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# The modules live in the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_photo(fname, width, height, square=None, **save_kwargs):
+    """Write a photo with a bright square on a noisy background."""
+    import numpy as np
+    import PIL.Image
+
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+    if square is not None:
+        x, y, size = square
+        block = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+        data[y : y + size, x : x + size] = block
+    PIL.Image.fromarray(data).save(fname, **save_kwargs)
+    return fname
+
+
+@pytest.fixture
+def jpeg(tmp_path):
+    """Write a JPEG with `write_photo`, returns a function of the size
+    (and position of the square)."""
+
+    def make(width, height, square=None, name="photo.jpg", **save_kwargs):
+        return write_photo(str(tmp_path / name), width, height, square, **save_kwargs)
+
+    return make
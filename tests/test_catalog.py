@@ -0,0 +1,170 @@
+import os
+import random
+from collections import Counter
+
+import pytest
+
+import catalog
+from benchmarks import catalog as benchmark
+from catalog import Catalog
+from uploadlog import UploadLog
+
+
+class Library:
+    """A photo folder, its upload log and its catalog."""
+
+    def __init__(self, tmp_path, compact_every=1000):
+        self.folder = tmp_path / "photos"
+        self.folder.mkdir()
+        self.log_fname = str(tmp_path / "uploaded.log")
+        self.upload_log = UploadLog(self.log_fname, compact_every)
+        self.fname = str(tmp_path / "catalog.sqlite")
+        self.mtime = 0
+
+    def _touch_folder(self):
+        # Every change gets a new mtime, even on a coarse file system
+        self.mtime += 1
+        os.utime(self.folder, (self.mtime, self.mtime))
+
+    def add(self, *names):
+        for name in names:
+            (self.folder / name).write_bytes(b"")
+        self._touch_folder()
+
+    def remove(self, *names):
+        for name in names:
+            (self.folder / name).unlink()
+        self._touch_folder()
+
+    def catalog(self):
+        return Catalog(self.fname, str(self.folder), self.upload_log)
+
+    def least_uploaded(self, catalog):
+        return sorted(os.path.basename(path) for path in catalog.least_uploaded())
+
+
+def check_buckets(catalog):
+    """Every photo in the folder is in the bucket of its upload count, at
+    a unique position in `range(size)`."""
+    db = catalog.db
+    buckets = dict(db.execute("SELECT n_uploads, size FROM buckets"))
+    rows = db.execute("SELECT n_uploads, pos FROM photos WHERE path IS NOT NULL")
+    positions = {}
+    for n_uploads, pos in rows:
+        assert pos is not None
+        positions.setdefault(n_uploads, []).append(pos)
+    assert buckets.keys() == positions.keys()
+    for n_uploads, pos in positions.items():
+        assert sorted(pos) == list(range(buckets[n_uploads]))
+    gone = db.execute("SELECT COUNT(*) FROM photos WHERE path IS NULL AND pos >= 0")
+    assert gone.fetchone()[0] == 0
+
+
+def n_uploads(catalog):
+    return dict(catalog.db.execute("SELECT name, n_uploads FROM photos"))
+
+
+@pytest.fixture
+def library(tmp_path):
+    return Library(tmp_path)
+
+
+def test_incremental_rescan(library):
+    library.add("a.jpg", "b.jpg", "c.jpg")
+    catalog = library.catalog()
+    assert library.least_uploaded(catalog) == ["a.jpg", "b.jpg", "c.jpg"]
+    library.upload_log.extend(["a.jpg", "b.jpg"])
+    catalog.update()
+    assert library.least_uploaded(catalog) == ["c.jpg"]
+    check_buckets(catalog)
+    # A new photo and an upload, seen by a catalog that is opened again
+    catalog.close()
+    library.add("d.jpg")
+    library.upload_log.append("c.jpg")
+    catalog = library.catalog()
+    assert library.least_uploaded(catalog) == ["d.jpg"]
+    assert n_uploads(catalog) == {"a.jpg": 1, "b.jpg": 1, "c.jpg": 1, "d.jpg": 0}
+    check_buckets(catalog)
+
+
+def test_unchanged_folder_is_not_scanned(library, monkeypatch):
+    library.add("a.jpg")
+    library.catalog().close()
+    monkeypatch.setattr(os, "scandir", None)  # Fails if it is called
+    catalog = library.catalog()
+    assert library.least_uploaded(catalog) == ["a.jpg"]
+
+
+def test_removed_photo_keeps_its_uploads(library):
+    library.add("a.jpg", "b.jpg", "c.jpg")
+    library.upload_log.extend(["a.jpg", "a.jpg", "b.jpg"])
+    catalog = library.catalog()
+    library.remove("c.jpg")
+    catalog.update()
+    assert library.least_uploaded(catalog) == ["b.jpg"]
+    library.remove("b.jpg")
+    library.upload_log.append("b.jpg")  # Uploaded while it was gone
+    catalog.update()
+    assert library.least_uploaded(catalog) == ["a.jpg"]
+    assert catalog.random_least_uploaded().endswith("a.jpg")
+    check_buckets(catalog)
+    # Coming back, "b.jpg" has as many uploads as "a.jpg"
+    library.add("b.jpg", "c.jpg")
+    catalog.update()
+    assert library.least_uploaded(catalog) == ["c.jpg"]
+    assert n_uploads(catalog) == {"a.jpg": 2, "b.jpg": 2, "c.jpg": 0}
+    check_buckets(catalog)
+
+
+def test_recount_after_compaction(tmp_path):
+    library = Library(tmp_path, compact_every=3)
+    library.add("a.jpg", "b.jpg", "c.jpg")
+    catalog = library.catalog()
+    library.upload_log.append("a.jpg")
+    catalog.update()
+    catalog.close()
+    # Compacted while the catalog was not looking
+    library.upload_log.extend(["b.jpg", "b.jpg", "a.jpg", "c.jpg"])
+    assert library.upload_log.since(1) is None
+    catalog = library.catalog()
+    assert n_uploads(catalog) == {"a.jpg": 2, "b.jpg": 2, "c.jpg": 1}
+    assert library.least_uploaded(catalog) == ["c.jpg"]
+    check_buckets(catalog)
+    # Incremental again
+    library.upload_log.append("c.jpg")
+    catalog.update()
+    assert n_uploads(catalog) == {"a.jpg": 2, "b.jpg": 2, "c.jpg": 2}
+    check_buckets(catalog)
+
+
+@pytest.mark.parametrize("threshold", [1000, 3])
+def test_buckets_stay_valid(library, monkeypatch, threshold):
+    """Random uploads, new and removed photos, incrementally (1000) or by
+    rebuilding the buckets (3)."""
+    monkeypatch.setattr(catalog, "REINDEX_THRESHOLD", threshold)
+    rng = random.Random(0)
+    names = [f"{i}.jpg" for i in range(30)]
+    in_folder = set(names[:20])
+    library.add(*in_folder)
+    cat = library.catalog()
+    for _ in range(50):
+        uploads = rng.choices(sorted(in_folder), k=rng.randrange(5))
+        library.upload_log.extend(uploads)
+        if rng.random() < 0.3:
+            library.remove(*rng.sample(sorted(in_folder), 2))
+        if rng.random() < 0.3:
+            library.add(*rng.sample(names, 3))
+        in_folder = {entry.name for entry in os.scandir(library.folder)}
+        cat.update()
+        check_buckets(cat)
+        counts = Counter(library.upload_log.counts)
+        least = min(counts[name] for name in in_folder)
+        expected = sorted(name for name in in_folder if counts[name] == least)
+        assert library.least_uploaded(cat) == expected
+        assert os.path.basename(cat.random_least_uploaded()) in expected
+
+
+def test_benchmark():
+    results = benchmark.measure(2000, repeat=3)
+    assert results["open and pick"] < results["build"] / 5
+    assert results["upload, open and pick"] < results["build"] / 5
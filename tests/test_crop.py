@@ -0,0 +1,104 @@
+import numpy as np
+import PIL.Image
+import pytest
+
+import instacron
+from benchmarks import crop
+from conftest import write_photo
+
+# (width, height, (x, y, size) of the subject) of photos whose crop must
+# keep the subject, which is close to an edge (but further than the
+# crop of a JPEG is moved to align it)
+SCENES = [
+    (3000, 1000, (100, 400, 200)),
+    (3000, 1000, (2700, 300, 200)),
+    (2400, 1000, (1900, 500, 300)),
+    (1000, 2000, (400, 50, 200)),
+    (1000, 2000, (300, 1700, 200)),
+]
+
+# Photos with the subject far from the edges, for "thirds"
+CENTERED = [
+    (3000, 1000, (1400, 450, 150)),
+    (3000, 1000, (1200, 100, 150)),
+    (1000, 2000, (400, 900, 150)),
+]
+
+
+@pytest.fixture(scope="module")
+def scene(tmp_path_factory):
+    """Like the `jpeg` fixture, but every photo is written once."""
+    directory = tmp_path_factory.mktemp("scenes")
+
+    def make(width, height, subject, name="photo.jpg"):
+        fname = directory / f"{width}x{height}-{subject[0]}-{subject[1]}-{name}"
+        if not fname.exists():
+            write_photo(str(fname), width, height, subject, compress_level=0)
+        return str(fname)
+
+    return make
+
+
+def contains(box, subject):
+    left, upper, right, lower = box
+    x, y, size = subject
+    return left <= x and x + size <= right and upper <= y and y + size <= lower
+
+
+@pytest.mark.parametrize("score", list(instacron.CROP_SCORES))
+@pytest.mark.parametrize("width, height, subject", SCENES)
+@pytest.mark.parametrize("name", ["photo.jpg", "photo.png"])
+def test_crop_keeps_the_subject(scene, name, width, height, subject, score):
+    photo = scene(width, height, subject, name)
+    box = instacron.crop_box_multiscale(photo, score=score)
+    assert contains(box, subject)
+    assert box[2] - box[0] == width or box[3] - box[1] == height
+    ratio = (box[2] - box[0]) / (box[3] - box[1])
+    assert 4 / 5 - 0.01 < ratio < 90 / 47 + 0.01
+
+
+@pytest.mark.parametrize("score", list(instacron.CROP_SCORES))
+@pytest.mark.parametrize("width, height, subject", SCENES)
+def test_exact_crop_keeps_the_subject(scene, width, height, subject, score):
+    with PIL.Image.open(scene(width, height, subject)) as img:
+        box = instacron.crop_box_maximize_entropy(img.convert("RGB"), score=score)
+    assert contains(box, subject)
+
+
+@pytest.mark.parametrize("width, height, subject", CENTERED)
+@pytest.mark.parametrize("name", ["photo.jpg", "photo.png"])
+def test_thirds_puts_the_subject_on_a_third(scene, name, width, height, subject):
+    photo = scene(width, height, subject, name)
+    box = instacron.crop_box_multiscale(photo, score="thirds")
+    axis = 0 if width > height else 1
+    x, size = subject[axis], subject[2]
+    position = (x + size / 2 - box[axis]) / (box[axis + 2] - box[axis])
+    assert min(abs(position - 1 / 3), abs(position - 2 / 3)) < 0.05
+
+
+def test_sliding_entropy_is_the_entropy_of_every_crop():
+    data = np.random.default_rng(0).integers(0, 256, (50, 90, 3), dtype=np.uint8)
+    scores = instacron.sliding_entropy(data, 40)
+    expected = [PIL.Image.fromarray(data[:, i : i + 40]).entropy() for i in range(51)]
+    assert scores == pytest.approx(expected)
+
+
+def test_faster_and_better_than_minimize_scalar():
+    """See `benchmarks/crop.py`, which does this on a 48 MP photo."""
+    pytest.importorskip("scipy")
+    results = crop.compare(3000, 1000)
+    old_seconds, old_entropy = results["minimize_scalar"]
+    for seconds, entropy in results.values():
+        assert seconds <= old_seconds
+        assert entropy >= old_entropy
+
+
+@pytest.fixture(scope="module")
+def score_seconds():
+    return crop.time_scores(*crop.SCORE_SIZE, repeat=2)
+
+
+@pytest.mark.parametrize("score", list(instacron.CROP_SCORES))
+def test_score_within_budget(score_seconds, score):
+    # Twice the budget, for slower or busy machines
+    assert score_seconds[score] <= 2 * crop.SCORE_BUDGETS[score]
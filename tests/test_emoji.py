@@ -0,0 +1,25 @@
+import emoji
+
+import instacron
+
+
+def names(theme):
+    return {emoji.UNICODE_EMOJI[e] for e in instacron.emoji_table(theme)}
+
+
+def test_themes_match_whole_words():
+    nature = names("nature")
+    assert {":palm_tree:", ":sunflower:", ":cloud_with_rain:"} <= nature
+    assert not {":train:", ":brain:", ":sunglasses:"} & nature
+    travel = names("travel")
+    assert {":world_map:", ":oncoming_bus:", ":camera:"} <= travel
+    assert not {":carrot:", ":credit_card:", ":minibus:"} & travel
+
+
+def test_no_theme_is_every_single_emoji_but_the_flags():
+    table = instacron.emoji_table()
+    assert set(instacron.emoji_table("nature")) < set(table)
+    assert len(table) > 1000
+    assert all(len(e) == 1 for e in table)
+    assert not any(emoji.UNICODE_EMOJI[e][1].isupper() for e in table)
+    assert instacron.flag("Peru") == emoji.emojize(":Peru:")
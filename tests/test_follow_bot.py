@@ -0,0 +1,151 @@
+import atexit
+import random
+import time
+import types
+
+import pytest
+
+import follow_bot
+import store
+from benchmarks import follows
+
+DAY = 86400
+
+# user id -> (status code of the lookup, info, age of the newest post in days)
+USERS = {
+    "1": (200, {"username": "one", "is_private": False}, 2),
+    "2": (200, {"username": "two", "is_private": True}, 2),
+    "3": (404, None, None),
+    "4": (429, None, None),
+    "5": (None, None, None),  # The request failed, without a response
+    "6": (200, {"username": "six", "is_private": False}, 30),
+}
+
+
+class FakeAPI:
+    def __init__(self):
+        self.last_json = None
+        self.last_response = types.SimpleNamespace(status_code=200)
+        self.lookups = []
+
+    def get_username_info(self, user_id):
+        self.lookups.append(user_id)
+        status_code, info, _ = USERS[user_id]
+        if status_code is None:
+            return False
+        self.last_response = types.SimpleNamespace(status_code=status_code)
+        self.last_json = {"user": info} if status_code == 200 else {"status": "fail"}
+        return status_code == 200
+
+
+class FakeBot:
+    """The parts of `instabot.Bot` that following a user takes."""
+
+    def __init__(self):
+        self.api = FakeAPI()
+        self.user_id = "0"
+        self.followed = []
+        self.liked = []
+        self.last = {}
+        self.blacklist_file = types.SimpleNamespace(set=set())
+        # user id -> its followers, and who I follow
+        self.followers = {"0": [], "1": ["10", "11"]}
+        self.following = []
+
+    def get_user_followers(self, user_id):
+        return self.followers[user_id]
+
+    def get_user_following(self, user_id):
+        return self.following
+
+    def check_user(self, user_id):
+        return True
+
+    def get_user_medias(self, user_id):
+        return [f"{user_id}_{i}" for i in range(5)]
+
+    def get_media_info(self, media_id):
+        age = USERS[media_id.split("_")[0]][2]
+        return [{"taken_at": time.time() - age * DAY}]
+
+    def reached_limit(self, key):
+        return False
+
+    def like_medias(self, medias):
+        self.liked.extend(medias)
+
+    def follow(self, user_id):
+        self.followed.append(user_id)
+
+
+@pytest.fixture
+def my_bot(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store.open_store.cache_clear()
+    my_bot = follow_bot.MyBot(FakeBot())
+    my_bot.candidates.workers = 0  # Vet in `follow_and_like` only
+    yield my_bot
+    atexit.unregister(my_bot.close)
+    my_bot.close()
+    store.open_store.cache_clear()
+
+
+def test_follow_and_like_follows_a_vetted_user(my_bot):
+    random.seed(0)
+    my_bot.to_follow.extend(USERS)
+    my_bot.follow_and_like()
+    my_bot.follow_and_like()  # Finds no one else
+    bot = my_bot.bot
+    assert bot.followed == ["1"]
+    assert sorted(bot.liked) == sorted(set(bot.liked))
+    assert {media.split("_")[0] for media in bot.liked} == {"1"}
+    assert "1" in my_bot.tmp_following
+    # Failed lookups are tried again later, the others are rejected
+    assert my_bot.to_follow.set == {"4", "5"}
+    assert my_bot.candidates.stats["failed"] >= 2
+    assert my_bot.user_infos.memory["3"][1] is None
+    assert "4" not in my_bot.user_infos.memory
+    assert "5" not in my_bot.user_infos.disk
+
+
+def test_failed_lookup_is_not_cached(my_bot):
+    with pytest.raises(RuntimeError):
+        my_bot.get_user_info("4")
+    with pytest.raises(RuntimeError):
+        my_bot.get_user_info("4")
+    assert my_bot.get_user_info("3") is None
+    assert my_bot.get_user_info("3") is None
+    assert my_bot.bot.api.lookups == ["4", "4", "3"]
+
+
+def test_update_to_follow_skips_friends_that_are_gone(my_bot, monkeypatch):
+    my_bot.friends.extend(["1", "3"])
+    monkeypatch.setattr(random, "choice", max)  # "3" first
+    assert my_bot.update_to_follow().set == {"10", "11"}
+    assert my_bot.scraped_friends.set == {"1", "3"}
+
+
+def test_like_media_from_nonfollowers_skips_users_that_are_gone(my_bot):
+    my_bot.bot.following = ["3"]
+    my_bot.like_media_from_nonfollowers()
+    assert my_bot.bot.liked == []
+    assert "3" not in my_bot.following
+    my_bot.following.add("3")
+    my_bot.following.add("1")
+    my_bot.like_media_from_nonfollowers()
+    assert {media.split("_")[0] for media in my_bot.bot.liked} == {"1"}
+
+
+def test_follow_and_like_skips_a_user_that_is_gone(my_bot, monkeypatch):
+    my_bot.to_follow.append("3")
+    monkeypatch.setattr(my_bot.candidates, "pop", lambda: ("3", ["3_0"]))
+    my_bot.follow_and_like()
+    assert my_bot.bot.followed == [] and my_bot.bot.liked == []
+    assert "3" not in my_bot.to_follow
+
+
+def test_maintenance_cycle_unfollows_the_oldest():
+    """See `benchmarks/follows.py`, which does this with 100k follows."""
+    seconds, ok = follows.cycle(2000)
+    assert ok
+    assert seconds < 1
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import gazetteer
+
+
+def write_gazetteer(fname, places):
+    """Write (name, lat, long, country code) in the GeoNames format."""
+    with open(fname, "w", encoding="utf-8") as f:
+        for i, (name, lat, long_, country_code) in enumerate(places):
+            cols = [str(i), name, name, "", str(lat), str(long_), "P", "PPL"]
+            f.write("\t".join(cols + [country_code, "", "0"]) + "\n")
+    return str(fname)
+
+
+@pytest.fixture
+def random_places(tmp_path):
+    rng = np.random.default_rng(0)
+    lat = np.degrees(np.arcsin(rng.uniform(-1, 1, 5000)))  # Uniform on the globe
+    long_ = rng.uniform(-180, 180, 5000)
+    places = [(f"p{i}", *latlong, "NL") for i, latlong in enumerate(zip(lat, long_))]
+    return gazetteer.Gazetteer(write_gazetteer(tmp_path / "places.txt", places))
+
+
+def brute_force(places, lat, long_):
+    distance = gazetteer._haversine(lat, long_, places["lat"], places["long"])
+    return distance.min()
+
+
+def test_nearest_is_exact(random_places):
+    rng = np.random.default_rng(1)
+    lat = np.concatenate([rng.uniform(-90, 90, 300), rng.uniform(80, 90, 300)])
+    lat *= rng.choice([-1, 1], len(lat))
+    long_ = rng.uniform(-180, 180, len(lat))
+    places = np.asarray(random_places.places)
+    for lat, long_ in zip(lat, long_):
+        place = random_places.nearest(lat, long_)
+        distance = gazetteer._haversine(lat, long_, place["lat"], place["long"])
+        assert distance == pytest.approx(brute_force(places, lat, long_))
+
+
+def test_nearest_across_the_pole(tmp_path):
+    places = [("Over the pole", 89.6, 180, "NO"), ("South", 85, 0, "NO")]
+    g = gazetteer.Gazetteer(write_gazetteer(tmp_path / "polar.txt", places))
+    assert g.nearest(89.6, 0)["name"] == b"Over the pole"
+    assert g.nearest(85.5, 0)["name"] == b"South"
+    assert g.nearest(-89.6, 0) is None  # Nothing within `max_rings` cells
+
+
+def test_reverse(tmp_path):
+    places = [("Amsterdam", 52.37, 4.89, "NL"), ("Lima", -12.04, -77.03, "PE")]
+    g = gazetteer.Gazetteer(write_gazetteer(tmp_path / "cities.txt", places))
+    assert g.reverse(52.3, 4.8) == (
+        "Amsterdam, Netherlands",
+        "Netherlands",
+        "nl",
+        "Amsterdam",
+    )
+    assert g.reverse(-12, -77)[0] == "Lima, Peru"
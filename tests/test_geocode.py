@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+import instacron
+from instacron import Address
+
+AMSTERDAM = Address("Amsterdam, Netherlands", "Netherlands", "nl", "Amsterdam")
+DAM = Address("Dam 1, Amsterdam, Netherlands", "Netherlands", "nl", "Amsterdam")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    from diskcache import Cache
+
+    with Cache(str(tmp_path / "geocode"), statistics=True) as cache:
+        yield cache
+
+
+def test_geocoders_do_not_share_addresses(cache):
+    calls = []
+
+    def gazetteer(lat, long_):
+        calls.append("gazetteer")
+        return AMSTERDAM
+
+    def osm(lat, long_):
+        calls.append("osm")
+        return DAM
+
+    for _ in range(2):
+        assert instacron.reverse_geocode(52.373, 4.893, cache=cache, geocode=osm) == DAM
+        address = instacron.reverse_geocode(
+            52.373, 4.893, cache=cache, geocode=gazetteer
+        )
+        assert address == AMSTERDAM
+    assert calls == ["osm", "gazetteer"]
+
+
+class CountingGeocode:
+    """A fake geocoder that remembers where it was asked."""
+
+    __name__ = "counting"
+
+    def __init__(self, address=AMSTERDAM):
+        self.address = address
+        self.calls = []
+
+    def __call__(self, lat, long_):
+        self.calls.append((lat, long_))
+        return self.address
+
+
+def test_hit_skips_the_network(cache):
+    geocode = CountingGeocode()
+    for _ in range(3):
+        address = instacron.reverse_geocode(52.373, 4.893, cache=cache, geocode=geocode)
+        assert address == AMSTERDAM and isinstance(address, Address)
+    assert geocode.calls == [(52.373, 4.893)]
+    assert cache.stats() == (2, 1)  # Hits, misses
+
+
+def test_nearby_points_share_an_address(cache):
+    geocode = CountingGeocode()
+    for lat, long_ in [(52.3731, 4.8929), (52.37349, 4.89251), (52.3724, 4.893)]:
+        instacron.reverse_geocode(lat, long_, cache=cache, geocode=geocode)
+    assert geocode.calls == [(52.3731, 4.8929), (52.3724, 4.893)]
+    # Coarser, within about 1 km
+    instacron.reverse_geocode(52.37, 4.89, precision=2, cache=cache, geocode=geocode)
+    instacron.reverse_geocode(52.369, 4.891, precision=2, cache=cache, geocode=geocode)
+    assert len(geocode.calls) == 3
+
+
+def test_no_address_is_not_cached(cache):
+    geocode = CountingGeocode(address=None)
+    for _ in range(2):
+        assert instacron.reverse_geocode(0, -30, cache=cache, geocode=geocode) is None
+    assert len(geocode.calls) == 2
+    assert len(cache) == 0
+    # Found later
+    geocode.address = AMSTERDAM
+    assert instacron.reverse_geocode(0, -30, cache=cache, geocode=geocode) == AMSTERDAM
+
+
+def test_expiry(cache, monkeypatch):
+    geocode = CountingGeocode()
+    t = time.time()
+    monkeypatch.setattr(time, "time", lambda: t)
+    instacron.reverse_geocode(52.373, 4.893, expire=60, cache=cache, geocode=geocode)
+    monkeypatch.setattr(time, "time", lambda: t + 59)
+    instacron.reverse_geocode(52.373, 4.893, expire=60, cache=cache, geocode=geocode)
+    assert len(geocode.calls) == 1
+    monkeypatch.setattr(time, "time", lambda: t + 61)
+    instacron.reverse_geocode(52.373, 4.893, expire=60, cache=cache, geocode=geocode)
+    assert len(geocode.calls) == 2
@@ -0,0 +1,73 @@
+import tracemalloc
+
+import PIL.Image
+import PIL.ImageFile
+import pytest
+
+import instacron
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    """Record the bytes of every image that PIL decodes."""
+    sizes = []
+    load = PIL.ImageFile.ImageFile.load
+
+    def recording_load(img):
+        result = load(img)
+        w, h = img.size
+        sizes.append(w * h * len(img.getbands()))
+        return result
+
+    monkeypatch.setattr(PIL.ImageFile.ImageFile, "load", recording_load)
+    return sizes
+
+
+@pytest.mark.parametrize("max_bytes", [2 ** 19, 2 ** 21, 2 ** 23, 2 ** 25])
+def test_decoding_stays_below_the_cap(jpeg, decoded, max_bytes):
+    photo = jpeg(4000, 1500, square=(3000, 500, 400))  # 18 MB of pixels
+    box = instacron.find_crop_box(photo, max_bytes=max_bytes)
+    fname = instacron.prepare_and_fix_photo(photo, max_bytes=max_bytes)
+    assert decoded and max(decoded) <= max_bytes
+    x, _, right, _ = box
+    assert x <= 3000 and right >= 3400  # Keeps the square
+    with PIL.Image.open(fname) as img:
+        assert img.width == instacron.INSTAGRAM_WIDTH
+
+
+def test_too_large_for_the_cap(jpeg):
+    photo = jpeg(2000, 800, name="photo.png")
+    with pytest.raises(ValueError):
+        instacron.find_crop_box(photo, max_bytes=2 ** 20)
+
+
+def test_never_holds_the_whole_photo(jpeg):
+    photo = jpeg(8000, 3000)  # 72 MB of pixels
+    max_bytes = 2 ** 25
+    instacron.find_crop_box(photo, max_bytes=2 ** 22)  # Import everything
+    tracemalloc.start()
+    try:
+        instacron.find_crop_box(photo, max_bytes=max_bytes)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < max_bytes
+
+
+@pytest.mark.parametrize(
+    "size, max_bytes",
+    [
+        ((1916, 1000), 2 ** 18),
+        ((1917, 1000), 2 ** 18),
+        ((1918, 1001), 2 ** 18),
+        ((1000, 1251), 2 ** 18),
+        ((1000, 1251), 2 ** 16),
+    ],
+)
+def test_single_offset_to_refine(jpeg, size, max_bytes):
+    """The reduced crop window can span the whole decoded photo."""
+    w, h = size
+    box = instacron.find_crop_box(jpeg(w, h), max_bytes=max_bytes)
+    x, y, right, lower = box
+    assert 0 <= x < right <= w and 0 <= y < lower <= h
+    assert 4 / 5 <= (right - x) / (lower - y) <= 90 / 47
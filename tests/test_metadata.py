@@ -0,0 +1,39 @@
+import os
+
+import PIL.Image
+
+import instacron
+
+
+def exif():
+    exif = PIL.Image.Exif()
+    exif[0x010F] = "Sony"  # Make
+    exif[0x0110] = "ILCE-7M3"  # Model
+    return exif
+
+
+def test_only_the_header_is_read(jpeg):
+    photo = jpeg(3000, 2000, exif=exif(), quality=95)
+    metadata = instacron.read_metadata(photo)
+    assert metadata.size == (3000, 2000)
+    assert metadata.format == "JPEG"
+    assert metadata.tags["Image Make"].printable == "Sony"
+    assert metadata.tags["Image Model"].printable == "ILCE-7M3"
+    assert os.path.getsize(photo) > 2 ** 20
+    assert metadata.bytes_read < 2 ** 16
+
+
+def test_read_once_per_photo(jpeg, monkeypatch):
+    photo = jpeg(1000, 500, exif=exif())
+    metadata = instacron.read_metadata(photo)
+    monkeypatch.setattr(instacron, "PhotoMetadata", None)  # Fails if it is called
+    assert instacron.read_metadata(photo) is metadata
+    assert not instacron.correct_ratio(photo)
+
+
+def test_replaced_photo_is_read_again(jpeg):
+    photo = jpeg(1000, 500, exif=exif())
+    assert instacron.read_metadata(photo).size == (1000, 500)
+    jpeg(800, 800)
+    os.utime(photo, (0, 0))  # It may be replaced within the resolution of mtime
+    assert instacron.read_metadata(photo).size == (800, 800)
@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+
+import instabot
+
+import instacron
+
+
+class UploadLog(list):
+    pass
+
+
+class Catalog:
+    def get_metadata(self, name):
+        return {"caption": "\n\nSomewhere"}
+
+
+def test_post_logs_in_from_the_pool(jpeg, tmp_path, monkeypatch):
+    """`post` logs in with a `session.Session` in a worker thread, with
+    a real `instabot.Bot` that only does not talk to Instagram."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    uploads = []
+    Bot = instabot.Bot
+
+    def bot_factory():
+        bot = Bot(base_path=str(tmp_path / "bot"))
+        bot.api.login = lambda **kwargs: True
+        bot.print_counters = lambda *args: None  # Writes a checkpoint at exit
+
+        def upload_photo(pic, caption):
+            main_thread = threading.current_thread() is threading.main_thread()
+            uploads.append((pic, caption, main_thread))
+            return True
+
+        bot.upload_photo = upload_photo
+        return bot
+
+    monkeypatch.setattr(instabot, "Bot", bot_factory)
+    monkeypatch.setattr(
+        instacron, "read_config", lambda: {"username": "me", "password": "pw"}
+    )
+    monkeypatch.setattr(instacron, "get_random_quote", lambda people: "A quote")
+    monkeypatch.setattr(instacron.time, "sleep", lambda t: None)
+
+    upload_log = UploadLog()
+    photo = jpeg(800, 800)
+    assert instacron.post(upload_log, Catalog(), fname=photo)
+    [(pic, caption, in_main_thread)] = uploads
+    assert caption == "A quote\n\nSomewhere"
+    assert in_main_thread
+    assert upload_log == ["photo.jpg"]
+    assert not os.path.exists(pic)
+    assert (tmp_path / ".config" / "instacron" / "me_logins.json").exists()
+
+
+def test_timed_records_the_stage():
+    timings = {}
+    assert instacron._timed(timings, "stage", lambda x: x + 1, 1) == 2
+    assert 0 <= timings["stage"] < 1
+    t_start = time.time()
+    instacron._timed(timings, "sleep", time.sleep, 0.01)
+    assert timings["sleep"] <= time.time() - t_start
+
+
+def test_prepare_writes_a_new_file_per_post(jpeg):
+    """Accounts that post at the same time must not share a file."""
+    photo = jpeg(800, 800)
+    first = instacron.prepare_and_fix_photo(photo)
+    second = instacron.prepare_and_fix_photo(photo)
+    try:
+        assert first != second
+        with open(first, "rb") as f1, open(second, "rb") as f2:
+            assert f1.read() == f2.read()
+    finally:
+        os.remove(first)
+        os.remove(second)
@@ -0,0 +1,98 @@
+import os
+import shutil
+
+import numpy as np
+import PIL.Image
+import PIL.ImageCms
+import pytest
+
+import instacron
+
+
+@pytest.fixture
+def prepared():
+    """Call `prepare_and_fix_photo` and remove the files it writes."""
+    fnames = []
+
+    def prepare(photo, **kwargs):
+        fnames.append(instacron.prepare_and_fix_photo(photo, **kwargs))
+        return fnames[-1]
+
+    yield prepare
+    for fname in fnames:
+        os.remove(fname)
+
+
+def read(fname):
+    with open(fname, "rb") as f:
+        return f.read()
+
+
+def pixels(fname):
+    with PIL.Image.open(fname) as img:
+        return np.asarray(img)
+
+
+def markers(data):
+    """The markers of the segments before the scan of a JPEG."""
+    found = []
+    i = 2
+    while data[i + 1] != 0xDA:
+        found.append(data[i + 1])
+        i += 2 + int.from_bytes(data[i + 2 : i + 4], "big")
+    return found
+
+
+def segment(marker, payload):
+    return bytes([0xFF, marker]) + (2 + len(payload)).to_bytes(2, "big") + payload
+
+
+def test_fitting_jpeg_is_not_encoded_again(jpeg, prepared):
+    exif = PIL.Image.Exif()
+    exif[0x010F] = "Sony"
+    icc = PIL.ImageCms.ImageCmsProfile(PIL.ImageCms.createProfile("sRGB")).tobytes()
+    photo = jpeg(1000, 800, exif=exif, icc_profile=icc, comment=b"Shot by me")
+    # Add Photoshop (APP13) and Ducky (APP12) metadata after the JFIF header
+    original = read(photo)
+    jfif = 4 + int.from_bytes(original[4:6], "big")
+    extra = segment(0xED, b"Photoshop 3.0\0") + segment(0xEC, b"Ducky\0")
+    with open(photo, "wb") as f:
+        f.write(original[:jfif] + extra + original[jfif:])
+    original = read(photo)
+    assert {0xE1, 0xE2, 0xEC, 0xED, 0xFE} <= set(markers(original))
+    fname = prepared(photo)
+    data = read(fname)
+    # The same scan (the compressed pixels), only without the metadata
+    assert data[data.index(b"\xff\xda") :] == original[original.index(b"\xff\xda") :]
+    assert not {0xE1, 0xEC, 0xED, 0xFE} & set(markers(data))
+    assert b"Exif" not in data and b"Shot by me" not in data
+    with PIL.Image.open(fname) as img:
+        assert img.info["icc_profile"] == icc
+    assert np.array_equal(pixels(fname), pixels(photo))
+
+
+def test_fitting_png_is_converted(jpeg, prepared):
+    photo = jpeg(1000, 800, name="photo.png")
+    with PIL.Image.open(prepared(photo)) as img:
+        assert img.format == "JPEG"
+        assert img.size == (1000, 800)
+
+
+def test_too_wide_jpeg_is_cropped(jpeg, prepared):
+    photo = jpeg(3000, 1000, square=(2000, 400, 200))
+    box = instacron.find_crop_box(photo)
+    assert box[0] <= 2000 and 2200 <= box[2]
+    with PIL.Image.open(prepared(photo, box=box)) as img:
+        w, h = img.size
+        assert w == min(box[2] - box[0], instacron.INSTAGRAM_WIDTH)
+        assert abs(w / h - (box[2] - box[0]) / 1000) < 0.01
+
+
+@pytest.mark.skipif(shutil.which("jpegtran") is None, reason="needs jpegtran")
+def test_jpegtran_crop_is_lossless(jpeg, prepared):
+    # Without chroma subsampling, the edges of the crop decode the same too
+    photo = jpeg(3000, 1000, square=(2000, 400, 200), subsampling=0)
+    box = instacron.find_crop_box(photo)
+    left, upper, right, lower = box
+    expected = pixels(photo)[upper:lower, left:right]
+    assert np.array_equal(pixels(prepared(photo, box=box)), expected)
@@ -0,0 +1,113 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+import instacron
+import quotes
+
+
+class QuoteServer(http.server.ThreadingHTTPServer):
+    """Stands in for the quote API, answering with the quotes in
+    `self.quotes` in turn."""
+
+    def __init__(self, quotes):
+        super().__init__(("127.0.0.1", 0), QuoteHandler)
+        self.quotes = quotes
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/api/1.0/?method=getQuote"
+
+
+class QuoteHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        quote = server.quotes[server.requests % len(server.quotes)]
+        server.requests += 1
+        body = json.dumps({"quoteText": quote, "quoteAuthor": "Someone"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = QuoteServer([f"Quote {i}" for i in range(100)])
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_pool(tmp_path, server):
+    def make_pool(**kwargs):
+        fetch = lambda key: instacron._get_random_quote(url=server.url)  # noqa: E731
+        return quotes.QuotePool(str(tmp_path / "quotes.json"), fetch, **kwargs)
+
+    return make_pool
+
+
+def wait_for_refills(pool):
+    for thread in list(pool.refills.values()):
+        thread.join(10)
+
+
+def test_get_random_quote(server):
+    assert instacron._get_random_quote(url=server.url) == "Quote 0"
+    assert instacron._get_random_quote(url=server.url) == "Quote 1"
+
+
+def test_pop_and_refill_in_the_background(make_pool, server):
+    pool = make_pool(low_watermark=2, size=4)
+    assert pool.pop() is None  # Empty, which starts a refill
+    wait_for_refills(pool)
+    assert pool.pool[quotes.GENERIC] == ["Quote 0", "Quote 1", "Quote 2", "Quote 3"]
+    assert pool.pop() == "Quote 0"
+    assert pool.pop() == "Quote 1"
+    assert not pool.refills[quotes.GENERIC].is_alive()  # Not below 2 yet
+    requests = server.requests
+    assert pool.pop() == "Quote 2"
+    wait_for_refills(pool)
+    assert server.requests == requests + 3
+    assert pool.pool[quotes.GENERIC] == ["Quote 3", "Quote 4", "Quote 5", "Quote 6"]
+
+
+def test_recent_quotes_are_not_used_again(make_pool, server):
+    pool = make_pool(size=2)
+    server.quotes = ["Same", "Other"]
+    pool.refill()
+    assert pool.pop() == "Same"
+    pool.refill()
+    wait_for_refills(pool)
+    # "Same" keeps coming back, but it was used
+    assert pool.pool[quotes.GENERIC] == ["Other"]
+    assert pool.recent == ["Same"]
+
+
+def test_pool_is_kept_on_disk(make_pool, server):
+    pool = make_pool(low_watermark=0, size=3)
+    pool.refill("Albert Einstein")
+    assert pool.pop("Albert Einstein") == "Quote 0"
+    pool = make_pool(low_watermark=0, size=3)
+    assert pool.pool == {"Albert Einstein": ["Quote 1", "Quote 2"]}
+    assert pool.recent == ["Quote 0"]
+    assert pool.pop("Albert Einstein") == "Quote 1"
+
+
+def test_empty_pools_warn(make_pool, monkeypatch, capsys):
+    pool = make_pool(low_watermark=0)
+    monkeypatch.setattr(instacron, "quote_pool", lambda: pool)
+    assert instacron.get_random_quote(["Albert Einstein"]) == ""
+    assert "the quote pools are empty" in capsys.readouterr().out
+    pool.pool[quotes.GENERIC] = ["Generic"]
+    assert instacron.get_random_quote(["Albert Einstein"]) == "Generic"
@@ -0,0 +1,54 @@
+import datetime
+import time
+
+import pytest
+
+from scheduler import Scheduler, parse_windows
+
+
+@pytest.fixture
+def amsterdam(monkeypatch):
+    """Local time is in Amsterdam, which has daylight saving time."""
+    monkeypatch.setenv("TZ", "Europe/Amsterdam")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+class NoJitter:
+    def uniform(self, a, b):
+        return a
+
+
+def local(*args):
+    return datetime.datetime(*args).timestamp()
+
+
+def scheduler_at(t, **kwargs):
+    return Scheduler(lambda: True, clock=lambda: t, rng=NoJitter(), **kwargs)
+
+
+@pytest.mark.parametrize("day", [(2026, 3, 29), (2026, 10, 25), (2026, 6, 1)])
+def test_windows_are_in_local_time(amsterdam, day):
+    """On the days the clock changes, midnight is 23 or 25 hours before 8."""
+    scheduler = scheduler_at(local(*day, 0, 30), windows=[(8, 10)])
+    assert datetime.datetime.fromtimestamp(scheduler.next_run).hour == 8
+
+
+def test_window_until_midnight(amsterdam):
+    scheduler = scheduler_at(local(2026, 10, 25, 23, 30), windows=[(20, 24)])
+    assert scheduler.next_run == local(2026, 10, 25, 23, 30)
+    scheduler = scheduler_at(local(2026, 10, 26, 0, 30), windows=[(20, 24)])
+    assert scheduler.next_run == local(2026, 10, 26, 20)
+
+
+def test_per_day_and_min_interval():
+    t = local(2026, 6, 1, 8, 30)
+    scheduler = scheduler_at(t, windows=parse_windows("8-10,14-16"), per_day=2)
+    assert scheduler.next_run == t
+    assert scheduler.step()
+    assert scheduler.next_run == local(2026, 6, 1, 9, 30)
+    scheduler.clock = lambda: local(2026, 6, 1, 9, 30)
+    assert scheduler.step()
+    assert scheduler.next_run == local(2026, 6, 2, 8)
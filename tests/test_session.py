@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+
+import instabot
+import requests
+
+import session
+
+
+def make_bot(tmp_path):
+    bot = instabot.Bot(base_path=str(tmp_path / "bot"))
+    bot.print_counters = lambda *args: None  # Writes a checkpoint at exit
+    return bot
+
+
+def test_login_in_a_thread(tmp_path):
+    """The scheduler logs every account in from its own thread."""
+    bot = make_bot(tmp_path)
+    bot.api.login = lambda **kwargs: True
+    login = session.Session("me", "pw", bot=bot, directory=str(tmp_path))
+    results = []
+    thread = threading.Thread(target=lambda: results.append(login.login()))
+    thread.start()
+    thread.join()
+    assert results == [True]
+    stats = login.stats
+    assert stats["logins"] + stats["resumes"] == 1
+
+
+def test_relogin_keeps_the_device(tmp_path):
+    """When Instagram rejects the stored cookies, instabot logs in with
+    the password but keeps the device ids stored with them."""
+    bot = make_bot(tmp_path)
+    api = bot.api
+    api.login_flow = lambda *args, **kwargs: False  # The cookies expired
+
+    def send_request(*args, **kwargs):
+        api.last_json = {"logged_in_user": {"pk": 1}}
+        return True
+
+    api.send_request = send_request
+    login = session.Session("me", "pw", bot=bot, directory=str(tmp_path))
+    uuids = {
+        "phone_id": "phone",
+        "uuid": "uuid",
+        "client_session_id": "client",
+        "advertising_id": "ad",
+        "device_id": "device",
+    }
+    cookie = {"sessionid": "old", "ds_user": "me", "urlgen": "", "csrftoken": ""}
+    stored = {
+        "cookie": cookie,
+        "uuids": uuids,
+        "timing_value": {"last_login": 0, "last_experiments": 0},
+        "device_settings": {"manufacturer": "Test"},
+        "user_agent": "Test",
+    }
+    with open(login.cookie_fname, "w") as f:
+        json.dump(stored, f)
+    # A long running process finds out that it is no longer logged in
+    login.logged_in, login.last_check = True, 0
+    api.session = requests.Session()
+    api.session.cookies = requests.utils.cookiejar_from_dict({"ds_user_id": "1"})
+
+    def get_username_info(user_id):
+        api.last_json = {"message": "login_required"}
+        return False
+
+    api.get_username_info = get_username_info
+    assert login.ensure()
+    assert (api.phone_id, api.uuid, api.device_id) == ("phone", "uuid", "device")
+    with open(login.cookie_fname) as f:
+        assert json.load(f)["uuids"] == uuids
+    assert oct(os.stat(login.cookie_fname).st_mode & 0o777) == "0o600"
@@ -0,0 +1,9 @@
+from benchmarks import startup
+
+
+def test_startup_budget():
+    """See `benchmarks/startup.py`, with some slack for busy machines."""
+    for path, (seconds, modules) in startup.measure(repeat=3).items():
+        imported = {module.split(".")[0] for module in modules}
+        assert not set(startup.HEAVY) & imported, path
+        assert seconds <= 2 * startup.BUDGETS[path], path
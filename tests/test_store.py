@@ -0,0 +1,146 @@
+import os
+import random
+
+import pytest
+
+from store import Snapshots, Store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = Store(str(tmp_path / "state.sqlite"))
+    yield store
+    store.close()
+
+
+def write_list(tmp_path, text, name="friends.txt", mtime=None):
+    fname = tmp_path / name
+    fname.write_text(text, encoding="utf-8")
+    if mtime is not None:
+        os.utime(fname, (mtime, mtime))
+    return str(fname)
+
+
+def positions(stored_list):
+    rows = stored_list.db.execute(
+        "SELECT pos FROM items WHERE list = ?", (stored_list.name,)
+    )
+    return sorted(pos for pos, in rows)
+
+
+def test_migrate(store, tmp_path):
+    fname = write_list(tmp_path, "3\n1\n\n2\n1\n", mtime=100)
+    friends = store.list(fname)
+    assert friends.name == "friends"
+    assert friends.list == ["3", "1", "2"]  # In the order of the file
+    assert friends.by_time() == [("3", 100), ("1", 100), ("2", 100)]
+    assert len(friends) == 3 and positions(friends) == [0, 1, 2]
+    # Only imported once
+    write_list(tmp_path, "4\n")
+    assert store.list(fname).set == {"1", "2", "3"}
+
+
+def test_migrate_timed(store, tmp_path):
+    fname = write_list(tmp_path, "1,20.5\n2,10\n", name="tmp_following.txt")
+    tmp_following = store.list(fname, timed=True)
+    assert tmp_following.by_time() == [("2", 10), ("1", 20.5)]
+    assert tmp_following.time("1") == 20.5
+
+
+@pytest.mark.parametrize("line", ["3", "3,yesterday"])
+def test_failed_migration_is_tried_again(store, tmp_path, line):
+    fname = write_list(tmp_path, f"1,10\n2,20\n{line}\n", name="tmp_following.txt")
+    with pytest.raises(ValueError):
+        store.list(fname, timed=True)
+    assert store.db.execute("SELECT COUNT(*) FROM lists").fetchone()[0] == 0
+    assert store.db.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+    write_list(tmp_path, "1,10\n2,20\n3,30\n", name="tmp_following.txt")
+    assert store.list(fname, timed=True).by_time() == [("1", 10), ("2", 20), ("3", 30)]
+
+
+def test_list_without_file(store, tmp_path):
+    friends = store.list(str(tmp_path / "friends.txt"))
+    assert len(friends) == 0 and friends.list == []
+    friends.append("1")
+    assert store.list(str(tmp_path / "friends.txt")).list == ["1"]
+
+
+def test_remove(store, tmp_path):
+    friends = store.list(str(tmp_path / "friends.txt"))
+    friends.extend(["1", "2", "3", "4"], t=1)
+    friends.remove("2")
+    friends.remove("5")  # Not in the list
+    assert friends.list == ["1", "3", "4"]
+    assert "2" not in friends and 3 in friends
+    assert positions(friends) == [0, 1, 2]
+    for item in ["4", "1", "3"]:
+        friends.remove(item)
+        assert positions(friends) == list(range(len(friends)))
+    assert len(friends) == 0
+    friends.append("2")
+    assert friends.list == ["2"] and positions(friends) == [0]
+
+
+def test_random(store, tmp_path):
+    friends = store.list(str(tmp_path / "friends.txt"))
+    with pytest.raises(IndexError):
+        friends.random()
+    friends.extend(str(i) for i in range(10))
+    friends.remove("0")
+    friends.remove("5")
+    random.seed(0)
+    picks = [friends.random() for _ in range(500)]
+    assert set(picks) == friends.set == {str(i) for i in range(10)} - {"0", "5"}
+
+
+def test_oldest_when_stored_out_of_order(store, tmp_path):
+    rng = random.Random(0)
+    times = [float(t) for t in range(100)]
+    rng.shuffle(times)
+    lines = "".join(f"{i},{t}\n" for i, t in enumerate(times[:50]))
+    fname = write_list(tmp_path, lines, name="tmp_following.txt")
+    tmp_following = store.list(fname, timed=True)
+    for i, t in enumerate(times[50:], 50):
+        tmp_following.append(str(i), t=t)
+    tmp_following.remove(str(times.index(0.0)))
+    # Without the removed oldest follow
+    by_time = sorted(
+        ((str(i), t) for i, t in enumerate(times) if t), key=lambda x: x[1]
+    )
+    assert tmp_following.by_time() == by_time
+    assert tmp_following.by_time(5) == by_time[:5]
+    assert tmp_following.by_time(3, reverse=True) == by_time[::-1][:3]
+    assert tmp_following.older_than(20.5) == by_time[:20]
+    assert tmp_following.older_than(20.5, limit=7) == by_time[:7]
+    assert tmp_following.older_than(0.5) == []
+
+
+def test_snapshot_changes_survive_a_restart(tmp_path):
+    fname = str(tmp_path / "state.sqlite")
+    downloads = []
+
+    def fetch():
+        downloads.append(True)
+        return [1, 2, 3]
+
+    store = Store(fname)
+    following = Snapshots(store, "following", fetch, ttl=3600)
+    assert following.set == {"1", "2", "3"}
+    following.add(4)
+    following.discard("1")
+    following.discard(5)  # Not followed
+    store.close()
+    # Restarted within `ttl`
+    store = Store(fname)
+    following = Snapshots(store, "following", fetch, ttl=3600)
+    assert following.set == {"2", "3", "4"}
+    assert len(downloads) == 1
+    assert Snapshots(store, "followers", fetch).set == {"1", "2", "3"}
+    # A new download replaces our changes
+    following.refresh()
+    store.close()
+    store = Store(fname)
+    following = Snapshots(store, "following", fetch, ttl=3600)
+    assert following.set == {"1", "2", "3"}
+    assert following.diff() == (set(), set())
+    store.close()
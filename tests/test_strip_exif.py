@@ -0,0 +1,56 @@
+import io
+import os
+import subprocess
+import sys
+
+import numpy as np
+import PIL.Image
+
+import instacron
+
+# Prints the peak RSS (in kB) before and after stripping a 6000x4000 photo
+PEAK_RSS = """
+import resource
+import PIL.Image
+import instacron
+
+img = PIL.Image.new("RGB", (6000, 4000), (10, 20, 30))
+img.load()
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+stripped = instacron.strip_exif(img)
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(before, after)
+"""
+
+
+def test_strip_exif_copies_the_buffer():
+    """A list of the pixels would take gigabytes, the copy 72 MB."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", PEAK_RSS],
+        cwd=root,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    before, after = map(int, output.split())
+    assert after - before < 1.5 * 6000 * 4000 * 3 / 1024
+
+
+def test_strip_exif_keeps_the_pixels(jpeg):
+    img = PIL.Image.open(jpeg(300, 200, exif=PIL.Image.Exif()))
+    stripped = instacron.strip_exif(img)
+    assert "exif" not in stripped.info
+    assert np.array_equal(np.asarray(stripped), np.asarray(img))
+
+
+def test_strip_exif_from_jpeg(jpeg):
+    exif = PIL.Image.Exif()
+    exif[0x010F] = "Sony"
+    with open(jpeg(300, 200, exif=exif), "rb") as f:
+        data = f.read()
+    stripped = instacron.strip_exif_from_jpeg(data)
+    assert b"Exif" in data and b"Exif" not in stripped
+    assert len(data) - len(stripped) < 2 ** 10
+    original = np.asarray(PIL.Image.open(io.BytesIO(data)))
+    assert np.array_equal(np.asarray(PIL.Image.open(io.BytesIO(stripped))), original)
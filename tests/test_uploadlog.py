@@ -0,0 +1,118 @@
+import os
+import runpy
+import shutil
+import time
+
+import pytest
+
+import instacron
+import uploadlog
+from uploadlog import UploadLog
+
+HOUR = 3600
+
+
+@pytest.fixture
+def fname(tmp_path):
+    return str(tmp_path / "uploaded.log")
+
+
+def test_reopen(fname):
+    log = UploadLog(fname)
+    log.extend(["a.jpg", "b.jpg"], t=1)
+    log.append("a.jpg", t=2)
+    log = UploadLog(fname)
+    assert log.counts == {"a.jpg": 2, "b.jpg": 1}
+    assert log.last_upload() == 2
+    assert log.seq == 3
+    assert log.since(1) == ["b.jpg", "a.jpg"]
+
+
+def test_torn_last_record(fname):
+    log = UploadLog(fname)
+    log.extend(["a.jpg", "b.jpg"], t=1)
+    size = os.path.getsize(fname)
+    log.append("c.jpg", t=2)
+    os.truncate(fname, os.path.getsize(fname) - 3)
+    log = UploadLog(fname)
+    assert log.counts == {"a.jpg": 1, "b.jpg": 1}
+    assert os.path.getsize(fname) == size
+    log.append("d.jpg", t=3)
+    assert UploadLog(fname).since(2) == ["d.jpg"]
+
+
+def test_compaction(fname):
+    log = UploadLog(fname, compact_every=3)
+    for i, name in enumerate("abcab"):
+        log.append(name, t=i)
+    assert log.base_seq == 3 and log.records == [("a", 3), ("b", 4)]
+    assert log.since(2) is None  # Compacted away
+    assert log.since(3) == ["a", "b"]
+    log = UploadLog(fname, compact_every=3)
+    assert log.counts == {"a": 2, "b": 2, "c": 1}
+    assert log.snapshot == {"a": (1, 0), "b": (1, 1), "c": (1, 2)}
+    assert log.last_upload() == 4
+    log.compact()
+    assert UploadLog(fname).snapshot == {"a": (2, 3), "b": (2, 4), "c": (1, 2)}
+
+
+def crash_on_write(monkeypatch, n):
+    """Let `_write_atomic` crash on its `n`th call."""
+    write_atomic = uploadlog._write_atomic
+    calls = []
+
+    def crashing(fname, data):
+        calls.append(fname)
+        if len(calls) == n:
+            raise KeyboardInterrupt
+        write_atomic(fname, data)
+
+    monkeypatch.setattr(uploadlog, "_write_atomic", crashing)
+
+
+@pytest.mark.parametrize("n", [1, 2])
+def test_crash_while_compacting(fname, monkeypatch, n):
+    """A crash before the snapshot (1) or the log (2) is replaced."""
+    log = UploadLog(fname)
+    log.extend(["a", "b"], t=1)
+    log.compact()
+    log.extend(["a", "c"], t=2)
+    crash_on_write(monkeypatch, n)
+    with pytest.raises(KeyboardInterrupt):
+        log.compact()
+    monkeypatch.undo()
+    log = UploadLog(fname)
+    assert log.counts == {"a": 2, "b": 1, "c": 1}
+    assert log.seq == 4
+    log.append("b", t=3)
+    assert UploadLog(fname).counts == {"a": 2, "b": 2, "c": 1}
+
+
+def test_migrate(tmp_path, fname):
+    uploaded_file = tmp_path / "uploaded.txt"
+    uploaded_file.write_text("a.jpg\nb.jpg\n\na.jpg\n", encoding="utf-8")
+    t = time.time() - 72 * HOUR
+    os.utime(uploaded_file, (t, t))
+    log = instacron.get_upload_log(str(tmp_path))
+    assert log.fname == fname
+    assert log.counts == {"a.jpg": 2, "b.jpg": 1}
+    assert log.last_upload() == pytest.approx(t)
+    log.append("c.jpg")
+    # Only migrated once
+    assert instacron.get_upload_log(str(tmp_path)).counts["a.jpg"] == 2
+
+
+@pytest.mark.parametrize("hours, posts", [(72, True), (2, False)])
+def test_cronjob_goes_by_the_last_upload(tmp_path, monkeypatch, hours, posts):
+    """Migrating the log just now does not count as an upload."""
+    uploaded_file = tmp_path / "uploaded.txt"
+    uploaded_file.write_text("a.jpg\n", encoding="utf-8")
+    t = time.time() - hours * HOUR
+    os.utime(uploaded_file, (t, t))
+    instacron.get_upload_log(str(tmp_path))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cronjob = shutil.copy(os.path.join(root, "cronjob.py"), tmp_path)
+    mains = []
+    monkeypatch.setattr(instacron, "main", lambda: mains.append(True))
+    runpy.run_path(cronjob)
+    assert mains == ([True] if posts else [])
@@ -0,0 +1,99 @@
+import types
+
+import pytest
+
+import follow_bot
+from user_infos import DAY, UserInfos
+
+
+class Fetch:
+    """Looks up the users in `infos`, the others do not exist."""
+
+    def __init__(self, infos):
+        self.infos = infos
+        self.calls = []
+
+    def __call__(self, user_id):
+        self.calls.append(user_id)
+        info = self.infos.get(user_id)
+        if isinstance(info, Exception):
+            raise info
+        return info
+
+
+@pytest.fixture
+def user_infos(tmp_path):
+    user_infos = UserInfos(str(tmp_path / "user_infos"), size=2)
+    yield user_infos
+    user_infos.close()
+
+
+def test_failed_lookup_is_not_remembered(user_infos):
+    fetch = Fetch({"1": RuntimeError("rate limited")})
+    with pytest.raises(RuntimeError):
+        user_infos.get("1", fetch)
+    fetch.infos["1"] = {"username": "one"}
+    assert user_infos.get("1", fetch) == {"username": "one"}
+    assert fetch.calls == ["1", "1"]
+
+
+def test_missing_user_is_remembered_for_a_day(user_infos, monkeypatch):
+    fetch = Fetch({})
+    assert user_infos.get("1", fetch) is None
+    assert user_infos.get("1", fetch) is None
+    assert fetch.calls == ["1"]
+    t = user_infos.memory["1"][0]
+    monkeypatch.setattr("user_infos.time.time", lambda: t + DAY + 1)
+    fetch.infos["1"] = {"username": "one"}
+    assert user_infos.get("1", fetch) == {"username": "one"}
+
+
+def test_outdated_fields_are_looked_up_again(user_infos, monkeypatch):
+    fetch = Fetch({"1": {"username": "one", "is_private": False}})
+    user_infos.get("1", fetch)
+    t = user_infos.memory["1"][0]
+    monkeypatch.setattr("user_infos.time.time", lambda: t + 2 * DAY)
+    user_infos.get("1", fetch)
+    assert fetch.calls == ["1"]
+    monkeypatch.setattr("user_infos.time.time", lambda: t + 8 * DAY)
+    user_infos.get("1", fetch, ["is_private"])
+    assert fetch.calls == ["1", "1"]
+
+
+def test_memory_keeps_the_most_recent(user_infos):
+    fetch = Fetch({u: {"username": u} for u in "123"})
+    for user_id in "1231":
+        user_infos.get(user_id, fetch)
+    assert list(user_infos.memory) == ["3", "1"]
+    assert fetch.calls == list("123")  # "1" came from disk
+    assert user_infos.stats["disk"]["hits"] == 1
+
+
+def fetch_with(api):
+    my_bot = types.SimpleNamespace(bot=types.SimpleNamespace(api=api))
+    return lambda user_id: follow_bot.MyBot._fetch_user_info(my_bot, user_id)
+
+
+class API:
+    """Answers `get_username_info` with `status_code` and `last_json`,
+    or without a response when the request raised."""
+
+    def __init__(self, status_code, last_json=None):
+        self.status_code = status_code
+        self.last_json = last_json
+        self.last_response = types.SimpleNamespace(status_code=200)
+
+    def get_username_info(self, user_id):
+        if self.status_code is not None:
+            self.last_response = types.SimpleNamespace(status_code=self.status_code)
+        return self.status_code == 200
+
+
+def test_only_not_found_is_missing():
+    fetch = fetch_with(API(200, {"user": {"username": "one"}, "status": "ok"}))
+    assert fetch("1") == {"username": "one"}
+    fetch = fetch_with(API(404, {"message": "User not found", "status": "fail"}))
+    assert fetch("1") is None
+    for status_code in [400, 429, 500, None]:
+        with pytest.raises(RuntimeError):
+            fetch_with(API(status_code))("1")
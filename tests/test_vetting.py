@@ -0,0 +1,46 @@
+import itertools
+import threading
+import time
+
+from vetting import Vetter
+
+
+def test_workers_keep_candidates_ready():
+    candidates = itertools.count()
+    vetted = []
+    lock = threading.Lock()
+
+    def vet(user_id):
+        assert lock.locked()  # `vet` is called under the lock
+        vetted.append(user_id)
+        if user_id % 3 == 1:
+            raise RuntimeError("rate limited")
+        return None if user_id % 3 == 2 else f"medias of {user_id}"
+
+    vetter = Vetter(lambda: next(candidates), vet, ready=2, workers=2, lock=lock)
+    vetter.min_interval = 0
+    vetter.start()
+    try:
+        t_start = time.time()
+        while not vetter.queue.full() and time.time() - t_start < 5:
+            time.sleep(0.01)
+        assert vetter.queue.full()
+    finally:
+        vetter.stop()
+    ready = [vetter.pop() for _ in range(2)]
+    assert all(result == f"medias of {user_id}" for user_id, result in ready)
+    assert len(set(vetted)) == len(vetted)
+    stats = vetter.stats
+    assert stats["accepted"] >= 2 and stats["failed"] >= 1 and stats["rejected"] >= 1
+    assert sum(stats.values()) == len(vetted)
+
+
+def test_pop_vets_when_none_is_ready():
+    candidates = iter([1, 2, 3, 4])
+    vetter = Vetter(lambda: next(candidates, None), lambda u: u if u > 2 else None)
+    vetter.workers = 0  # Only vet in `pop`
+    assert vetter.pop() == (3, 3)
+    assert vetter.pop() == (4, 4)
+    assert vetter.pop(max_attempts=3) is None
+    assert vetter.stats == {"accepted": 2, "rejected": 2, "failed": 0}
+    assert not vetter.taken
@@ -0,0 +1,208 @@
+"""Append-only log of the uploaded photos, replacing `uploaded.txt`.
+
+Every upload is appended to `uploaded.log` as a small binary record.
+Every `compact_every` uploads, the log is folded into
+`uploaded.log.snapshot`, which holds the upload count and the time of
+the last upload of every photo, and the log starts over. Opening the log
+therefore never costs more than reading at most `compact_every` records
+and (only when the counts are needed) one entry per photo.
+
+Both files are written with fsync, and the snapshot and the emptied log
+are swapped in with an atomic rename. A generation number in their
+headers tells whether a log has already been folded into the snapshot,
+so a crash at any point neither loses nor double counts an upload.
+
+Import an existing `uploaded.txt` with
+    python uploadlog.py uploaded.txt uploaded.log
+"""
+
+import os
+import struct
+import time
+
+LOG_MAGIC = b"ICLOG001"
+SNAPSHOT_MAGIC = b"ICSNAP01"
+HEADER = struct.Struct("<QQ")  # generation, sequence number of the first record
+RECORD = struct.Struct("<Hd")  # length of the name, time of the upload
+ENTRY = struct.Struct("<HId")  # length of the name, count, time of the last upload
+
+
+def _fsync_dir(fname):
+    fd = os.open(os.path.dirname(os.path.abspath(fname)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(fname, data):
+    tmp = fname + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, fname)
+    _fsync_dir(fname)
+
+
+def _encode_record(name, t):
+    name = name.encode("utf-8")
+    return RECORD.pack(len(name), t) + name
+
+
+class UploadLog:
+    """The uploads that were made, see the module docstring.
+
+    Records are numbered consecutively over the whole history, `seq` is
+    the number of uploads ever appended and `since(seq)` returns the
+    photos uploaded after that, as long as they are still in the log.
+    """
+
+    def __init__(self, fname, compact_every=1000):
+        self.fname = fname
+        self.snapshot_fname = fname + ".snapshot"
+        self.compact_every = compact_every
+        self._snapshot = None  # {name: (count, last upload)}, read when needed
+        generation, base_seq = self._read_snapshot_header()
+        log = self._read_log() if os.path.exists(fname) else None
+        if log is None or log[0] < generation:
+            # No log yet, or we crashed after the snapshot was written
+            # but before the log was emptied.
+            _write_atomic(fname, LOG_MAGIC + HEADER.pack(generation, base_seq))
+            records = []
+        else:
+            generation, base_seq, records, size = log
+            if size != os.path.getsize(fname):
+                # Remove a record that was only partly written.
+                os.truncate(fname, size)
+        self.generation = generation
+        self.base_seq = base_seq
+        self.records = records
+
+    def _read_snapshot_header(self):
+        try:
+            with open(self.snapshot_fname, "rb") as f:
+                header = f.read(len(SNAPSHOT_MAGIC) + HEADER.size)
+        except FileNotFoundError:
+            return 0, 0
+        if header[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{self.snapshot_fname} is not a snapshot.")
+        return HEADER.unpack_from(header, len(SNAPSHOT_MAGIC))
+
+    def _read_snapshot(self):
+        snapshot = {}
+        if not os.path.exists(self.snapshot_fname):
+            return snapshot
+        with open(self.snapshot_fname, "rb") as f:
+            data = f.read()
+        i = len(SNAPSHOT_MAGIC) + HEADER.size
+        while i < len(data):
+            n, count, last = ENTRY.unpack_from(data, i)
+            i += ENTRY.size
+            snapshot[data[i : i + n].decode("utf-8")] = (count, last)
+            i += n
+        return snapshot
+
+    def _read_log(self):
+        """The header, the complete records and the size they take."""
+        with open(self.fname, "rb") as f:
+            data = f.read()
+        if data[: len(LOG_MAGIC)] != LOG_MAGIC:
+            raise ValueError(f"{self.fname} is not an upload log.")
+        generation, base_seq = HEADER.unpack_from(data, len(LOG_MAGIC))
+        i = len(LOG_MAGIC) + HEADER.size
+        records = []
+        while i + RECORD.size <= len(data):
+            n, t = RECORD.unpack_from(data, i)
+            if i + RECORD.size + n > len(data):
+                break
+            name = data[i + RECORD.size : i + RECORD.size + n].decode("utf-8")
+            records.append((name, t))
+            i += RECORD.size + n
+        return generation, base_seq, records, i
+
+    @property
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = self._read_snapshot()
+        return self._snapshot
+
+    @property
+    def seq(self):
+        return self.base_seq + len(self.records)
+
+    def since(self, seq):
+        """The photos uploaded after the first `seq` uploads, or None if
+        those were compacted away."""
+        if not self.base_seq <= seq <= self.seq:
+            return None
+        return [name for name, _ in self.records[seq - self.base_seq :]]
+
+    @property
+    def counts(self):
+        """How many times every photo has been uploaded."""
+        counts = {name: count for name, (count, _) in self.snapshot.items()}
+        for name, _ in self.records:
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def last_upload(self):
+        """Time of the latest upload, or None if nothing was uploaded."""
+        if self.records:
+            return self.records[-1][1]
+        return max((last for _, last in self.snapshot.values()), default=None)
+
+    def extend(self, names, t=None):
+        """Record the upload of `names` at time `t` (default now)."""
+        t = time.time() if t is None else t
+        with open(self.fname, "ab") as f:
+            f.write(b"".join(_encode_record(name, t) for name in names))
+            f.flush()
+            os.fsync(f.fileno())
+        self.records.extend((name, t) for name in names)
+        if len(self.records) >= self.compact_every:
+            self.compact()
+
+    def append(self, name, t=None):
+        self.extend([name], t)
+
+    def compact(self):
+        """Fold the log into the snapshot and start an empty log."""
+        snapshot = dict(self.snapshot)
+        for name, t in self.records:
+            count, last = snapshot.get(name, (0, t))
+            snapshot[name] = (count + 1, max(last, t))
+        generation, seq = self.generation + 1, self.seq
+        entries = []
+        for name, (count, last) in snapshot.items():
+            name = name.encode("utf-8")
+            entries.append(ENTRY.pack(len(name), count, last) + name)
+        header = SNAPSHOT_MAGIC + HEADER.pack(generation, seq)
+        _write_atomic(self.snapshot_fname, header + b"".join(entries))
+        _write_atomic(self.fname, LOG_MAGIC + HEADER.pack(generation, seq))
+        self._snapshot = snapshot
+        self.generation, self.base_seq, self.records = generation, seq, []
+
+
+def migrate(uploaded_file, fname):
+    """Import the uploads in the text file `uploaded_file` into a log.
+
+    The text file does not know when the uploads happened, so they all
+    get the modification time of the file."""
+    with open(uploaded_file, encoding="utf-8") as f:
+        names = [line.rstrip() for line in f if line.strip()]
+    log = UploadLog(fname)
+    log.extend(names, t=os.path.getmtime(uploaded_file))
+    log.compact()
+    return log
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import uploaded.txt into a log.")
+    parser.add_argument("uploaded_file", help="the existing uploaded.txt")
+    parser.add_argument("fname", help="the upload log to create or add to")
+    args = parser.parse_args()
+    log = migrate(args.uploaded_file, args.fname)
+    print(f"{args.fname} now holds {log.seq} uploads of {len(log.counts)} photos.")
@@ -0,0 +1,154 @@
+"""The infos of Instagram users that `follow_bot.py` looks up.
+
+Looking up a user is a request to Instagram, so the infos are stored on
+disk (in a `diskcache.Cache`) for 60 days, and the most recently used
+ones also in memory. Fields that change often, like the number of
+followers, are looked up again sooner, see `FIELD_EXPIRY`. That a user
+does not exist (anymore) or blocked us is remembered for a day, a lookup
+that failed for another reason (like a rate limit) is not remembered.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from diskcache import Cache
+
+DAY = 86400
+
+# Seconds after which a field is outdated, the others last `UserInfos.expiry`
+FIELD_EXPIRY = {
+    "follower_count": DAY,
+    "following_count": DAY,
+    "media_count": DAY,
+    "is_private": 7 * DAY,
+}
+
+TIERS = ("memory", "disk", "network")
+
+
+class UserInfos:
+    """User infos in memory (the `size` most recently used) in front of
+    the ones on disk in `directory`.
+
+    `stats` holds the hits, misses and seconds spent of every tier in
+    `TIERS`, a miss of the "network" is a user that was not found.
+    """
+
+    def __init__(
+        self,
+        directory,
+        size=1000,
+        expiry=60 * DAY,
+        negative_expiry=DAY,
+        field_expiry=FIELD_EXPIRY,
+    ):
+        self.disk = Cache(directory)
+        self.memory = OrderedDict()  # user_id -> (time of lookup, info)
+        self.size = size
+        self.expiry = expiry
+        self.negative_expiry = negative_expiry
+        self.field_expiry = field_expiry
+        self.lock = threading.Lock()
+        self.stats = {tier: {"hits": 0, "misses": 0, "seconds": 0.0} for tier in TIERS}
+
+    def _count(self, tier, hit, t_start):
+        with self.lock:
+            stats = self.stats[tier]
+            stats["hits" if hit else "misses"] += 1
+            stats["seconds"] += time.perf_counter() - t_start
+
+    def _is_fresh(self, entry, fields):
+        t, info = entry
+        if info is None:
+            max_age = self.negative_expiry
+        else:
+            max_age = min(
+                [self.expiry] + [self.field_expiry.get(f, self.expiry) for f in fields]
+            )
+        return time.time() - t < max_age
+
+    def _remember(self, user_id, entry):
+        with self.lock:
+            self.memory[user_id] = entry
+            self.memory.move_to_end(user_id)
+            if len(self.memory) > self.size:
+                self.memory.popitem(last=False)
+
+    def _from_memory(self, user_id, fields):
+        t_start = time.perf_counter()
+        with self.lock:
+            entry = self.memory.get(user_id)
+            if entry is not None:
+                self.memory.move_to_end(user_id)
+        hit = entry is not None and self._is_fresh(entry, fields)
+        self._count("memory", hit, t_start)
+        return entry if hit else None
+
+    def _from_disk(self, user_id, fields):
+        t_start = time.perf_counter()
+        info, expire_time = self.disk.get(user_id, default=False, expire_time=True)
+        # False is also how older versions stored a user that was not found
+        entry = None
+        if info is not False:
+            expiry = self.negative_expiry if info is None else self.expiry
+            entry = expire_time - expiry, info
+        hit = entry is not None and self._is_fresh(entry, fields)
+        self._count("disk", hit, t_start)
+        if not hit:
+            return None
+        self._remember(user_id, entry)
+        return entry
+
+    def _from_network(self, user_id, fetch):
+        t_start = time.perf_counter()
+        info = fetch(user_id)
+        self._count("network", info is not None, t_start)
+        expiry = self.negative_expiry if info is None else self.expiry
+        self.disk.set(user_id, info, expire=expiry, tag="user_info")
+        entry = time.time(), info
+        self._remember(user_id, entry)
+        return entry
+
+    def get(self, user_id, fetch, fields=()):
+        """The info of `user_id`, looked up with `fetch(user_id)` if there
+        is none or if one of `fields` is outdated. None if the user does
+        not exist or blocked us.
+
+        `fetch` returns None only for such a user, which is remembered,
+        and raises when the lookup fails otherwise (e.g. when we are rate
+        limited), which is not."""
+        entry = (
+            self._from_memory(user_id, fields)
+            or self._from_disk(user_id, fields)
+            or self._from_network(user_id, fetch)
+        )
+        return entry[1]
+
+    def prefetch(self, user_ids, fetch=None, fields=()):
+        """Read the infos of `user_ids` from disk in one transaction and
+        (with `fetch`) look up the missing ones. Returns those."""
+        missing = []
+        with self.disk.transact():
+            for user_id in user_ids:
+                if self._from_memory(user_id, fields) is None:
+                    if self._from_disk(user_id, fields) is None:
+                        missing.append(user_id)
+        if fetch is not None:
+            for user_id in missing:
+                self._from_network(user_id, fetch)
+        return missing
+
+    def report(self):
+        lines = []
+        for tier, stats in self.stats.items():
+            n = stats["hits"] + stats["misses"]
+            ms = 1000 * stats["seconds"] / max(n, 1)
+            lines.append(
+                f"{tier}: {stats['hits']} hits, {stats['misses']} misses,"
+                f" {ms:.3f} ms per lookup"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        self.disk.close()
@@ -0,0 +1,112 @@
+"""Candidates to follow, vetted ahead of time.
+
+Vetting a candidate for `MyBot.follow_and_like` takes a few requests
+(its info, `bot.check_user`, its medias and the date of the newest
+one) and most candidates are rejected. A `Vetter` does this in
+background threads and keeps a few accepted candidates ready, so
+following one does not have to wait for it.
+"""
+
+import queue
+import threading
+import time
+from contextlib import nullcontext
+
+
+class Vetter:
+    """Keeps up to `ready` candidates that passed `vet` in a queue.
+
+    `next_candidate()` returns a user id to consider (None if there is
+    none) and `vet(user_id)` returns what is needed to follow it, or None
+    if it is rejected. `workers` threads vet candidates, each at most one
+    every `min_interval` seconds.
+
+    Both functions are called while holding `lock`, if given. instabot's
+    API is not thread-safe (it keeps the last response in `last_json`),
+    so `MyBot` passes the lock that it holds while it uses the bot
+    itself, and the vetting happens while it sleeps.
+    """
+
+    def __init__(
+        self, next_candidate, vet, ready=3, workers=1, min_interval=5, lock=None
+    ):
+        self.next_candidate = next_candidate
+        self.vet = vet
+        self.queue = queue.Queue(ready)
+        self.workers = workers
+        self.min_interval = min_interval
+        self.lock = nullcontext() if lock is None else lock
+        self.taken = set()  # user ids that are being vetted or in the queue
+        self.taken_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.stats = {"accepted": 0, "rejected": 0, "failed": 0}
+
+    def vet_one(self):
+        """Vet a single candidate, returns (user_id, result) if it passes."""
+        with self.lock:
+            try:
+                user_id = self.next_candidate()
+            except Exception as e:
+                print(f"Finding a candidate failed: {e!r}")
+                return None
+            with self.taken_lock:
+                if user_id is None or user_id in self.taken:
+                    return None
+                self.taken.add(user_id)
+            try:
+                result = self.vet(user_id)
+            except Exception as e:
+                print(f"Vetting {user_id} failed: {e!r}")
+                result, outcome = None, "failed"
+            else:
+                outcome = "rejected" if result is None else "accepted"
+        with self.taken_lock:
+            self.stats[outcome] += 1
+            if result is None:
+                self.taken.discard(user_id)
+        return None if result is None else (user_id, result)
+
+    def _work(self):
+        while not self.stopped.is_set():
+            t_start = time.time()
+            candidate = self.vet_one()
+            while candidate is not None and not self.stopped.is_set():
+                try:
+                    self.queue.put(candidate, timeout=1)
+                    break
+                except queue.Full:
+                    pass
+            self.stopped.wait(self.min_interval - (time.time() - t_start))
+
+    def start(self):
+        """Start the worker threads, unless they are running."""
+        if self.threads:
+            return
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def pop(self, max_attempts=20):
+        """An accepted (user_id, result), vetted right away if none is
+        ready. None if `max_attempts` candidates in a row did not pass."""
+        self.start()
+        try:
+            candidate = self.queue.get_nowait()
+        except queue.Empty:
+            candidate = None
+            for _ in range(max_attempts):
+                candidate = self.vet_one()
+                if candidate is not None:
+                    break
+        if candidate is not None:
+            with self.taken_lock:
+                self.taken.discard(candidate[0])
+        return candidate